@@ -1,155 +1,564 @@
-import re
 import os
+import time
+import queue
+import threading
 import tkinter as tk
 import tkinter.font as tkfont
 from tkinter import filedialog, messagebox, ttk
 from tkinterdnd2 import DND_FILES, TkinterDnD
-from datetime import datetime
+from bisect import bisect_right
+from itertools import chain, islice
+from contextlib import ExitStack
 from pathlib import Path
+import sqlite3
+import textwrap
 import subprocess
 
-def parse_log(file_path, min_keyword_filter=True, use_utc=False):
-    with open(file_path, 'r', encoding='utf-8', errors='ignore') as f:
-        contents = f.read()
-
-    lines = contents.splitlines()
-    player_name = None
-    start_time = None
-    end_time = None
-
-    # Player name detection
-    login_rx = re.compile(r'^([0-9\.]+) Sys \[Info\]: Logged in (\S+)')
-    for L in lines:
-        if m := login_rx.match(L):
-            player_name = m.group(2)
-            break
-
-    # Start time detection
-    diag_rx = re.compile(r'^([0-9\.]+) Sys \[Diag\]: Current time: [^\[]+\[UTC: ([^\]]+)\]')
-    for L in lines:
-        if m := diag_rx.match(L):
-            offset = float(m.group(1))
-            utc_dt = datetime.strptime(m.group(2), "%a %b %d %H:%M:%S %Y")
-            start_time = utc_dt.timestamp() - offset
-            break
-    if start_time is None:
-        start_time = Path(file_path).stat().st_mtime
-
-    # End time detection
-    ts_rx = re.compile(r'^([0-9\.]+)')
-    for L in reversed(lines):
-        if m := ts_rx.match(L):
-            end_time = start_time + float(m.group(1))
-            break
-    else:
-        end_time = start_time
-
-    # Event parsing
-    event_rx = re.compile(r"([0-9\.]+) Game \[Info\]: ([^\r\n]+?) was ([^ ]+) by ([^\r\n]+?) damage ?([^\r\n]*)")
-    warn_rx = re.compile(r'^([0-9\.]+) Game \[Warning\]:\s*(.*)')
-
-    combat_events = []
-    warning_groups = {}
-    event_offsets = set()
-
-    # Process combat events
-    for m in event_rx.finditer(contents):
-        off = float(m.group(1))
-        event_offsets.add(off)
-        t_format = datetime.utcfromtimestamp if use_utc else datetime.fromtimestamp
-        t = t_format(start_time + off).strftime("%H:%M:%S")
-        
-        victim = m.group(2)
-        state = m.group(3)
-        damage_info = m.group(4)
-        source = m.group(5).strip() if m.group(5) else 'from an unknown source'
-
-        if victim == "RAZORFLIES":
-            continue
-
-        # Health/damage split
-        health, damage = "unknown", damage_info
-        if " / " in damage_info:
-            parts = damage_info.split(" / ")
-            if len(parts) == 2:
-                health, damage = parts
-
-        # Format message
-        if state == "downed":
-            message = f"{t} - <{victim}> downed at {health} health {source.replace('from a', 'by a')}"
+from ee_parser import LogParser
+from ee_cache import ParseCache
+from ee_archive import QUERIES, SessionArchive, query_params
+from ee_profile import PhaseTimer
+from ee_watch import LogWatcher
+from ee_rules import default_rules_path, load_rules
+from ee_export import COMBAT_COLUMNS, WARNING_COLUMNS, combat_record, warning_record, write_records
+from ee_stats import SessionStats
+from ee_spill import SpillFile, parse_retention
+from ee_search import COMBAT_SEARCH, WARNING_SEARCH, SEARCH_SPECS, SearchIndex
+
+class ParseCancelled(Exception):
+    pass
+
+class ParseWorker(threading.Thread):
+    """Runs LogParser.update() off the Tk thread.
+
+    Progress, the resulting delta or the error are posted to self.queue as
+    ('progress', done, total), ('done', delta) and ('error', exc) tuples for
+    the GUI to poll. path is set for full loads and None for tail updates.
+    Full loads given a cache start from the cached parser when the log has
+    only grown since, and save the result back. final and timer are passed
+    on to LogParser.update(); only a log that will be watched should keep
+    its trailing partial line back for the next update.
+
+    When the whole log was (re)read, the rows, search indexes and stats the
+    GUI starts from are built here as well and left in self.rows,
+    self.indexes and self.stats; they stay None for tail updates. Given a
+    live mode retention (minutes, rows), the rows already outside it are
+    retired here too, into a SpillFile left in self.spill.
+    """
+
+    def __init__(self, parser, path=None, cache=None, timer=None, final=False, retention=None):
+        super().__init__(daemon=True)
+        self.parser = parser
+        self.path = path
+        self.cache = cache
+        self.final = final
+        self.retention = retention
+        self.timer = timer or PhaseTimer(enabled=False)
+        self.rows = self.indexes = self.stats = self.spill = None
+        self.started = time.perf_counter()
+        self.queue = queue.Queue()
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def run(self):
+        try:
+            if self.cache:
+                self.parser = self.cache.load(self.path, self.parser.min_keyword_filter,
+                                              self.parser.clock.use_utc, self.parser.rules) or self.parser
+            delta = self.parser.update(self.final, progress=self.report, timer=self.timer)
+            if self.cache:
+                try:
+                    self.cache.store(self.parser)
+                except OSError:
+                    pass  # a read-only or full cache dir only costs the next load
+            if self.path or delta['Reset']:
+                self.prepare()
+            self.queue.put(('done', delta))
+        except ParseCancelled:
+            pass
+        except Exception as e:
+            self.queue.put(('error', e))
+
+    def report(self, done, total):
+        if self.cancelled.is_set():
+            raise ParseCancelled()
+        self.queue.put(('progress', done, total))
+
+    def prepare(self):
+        # Stats cover the whole session, so they are taken before retiring
+        with self.timer.phase('stats'):
+            self.stats = SessionStats()
+            self.stats.add_events(self.parser.combat_events)
+            self.stats.add_groups(self.parser.warning_groups.values())
+        if self.retention and self.retention != (None, None):
+            with self.timer.phase('retire'):
+                retired = self.parser.retire(*retire_args(self.parser, self.retention, RETIRE_BATCH))
+                if retired:
+                    self.spill = SpillFile()
+                    self.spill.add(retired)
+                    self.stats.forget_groups(retired.get('WarningGroups', ()))
+        events, groups = list(self.parser.combat_events), list(self.parser.warning_groups.values())
+        with self.timer.phase('index', rows=len(events) + len(groups)):
+            self.indexes = {
+                'combat': SearchIndex(COMBAT_SEARCH).add(events),
+                'warnings': SearchIndex(WARNING_SEARCH).add(groups)
+            }
+        self.rows = {'combat': events, 'warnings': groups}
+
+RETIRE_BATCH = 2000     # rows retired at a time, so lists are cut now and then
+
+def retire_args(parser, retention, batch):
+    # LogParser.retire() arguments for a (minutes, rows) retention policy
+    minutes, keep = retention
+    last = parser.last_offset
+    before = last - minutes * 60 if minutes and last is not None else None
+    slack = batch if keep is None else max(1, min(batch, keep // 10))
+    return before, keep, slack
+
+class ExportCancelled(Exception):
+    pass
+
+class ExportWorker(threading.Thread):
+    """Streams rows to a file off the Tk thread.
+
+    rows is a list of Row adapters taken on the Tk thread, or any iterable
+    of rows given with their total; each is turned into a record and
+    written with ee_export in chunks, so the output is never held in
+    memory. It goes to a .part file renamed over path once complete, so a
+    cancelled or failed export leaves nothing behind.
+    Reports through self.queue like ParseWorker, counting rows.
+    """
+
+    def __init__(self, path, rows, record, fmt, columns, total=None):
+        super().__init__(daemon=True)
+        self.path = path
+        self.rows = rows
+        self.total = len(rows) if total is None else total
+        self.record = record
+        self.fmt = fmt
+        self.columns = columns
+        self.queue = queue.Queue()
+        self.cancelled = threading.Event()
+
+    def cancel(self):
+        self.cancelled.set()
+
+    def run(self):
+        part = self.path + '.part'
+        try:
+            with open(part, 'w', encoding='utf-8', newline='', buffering=2**20) as f:
+                count = write_records(map(self.record, self.rows), f, self.fmt, self.columns,
+                                      self.report, self.total)
+            os.replace(part, self.path)
+            self.queue.put(('done', count))
+        except Exception as e:
+            try:
+                os.remove(part)
+            except OSError:
+                pass
+            if not isinstance(e, ExportCancelled):
+                self.queue.put(('error', e))
+
+    def report(self, done, total):
+        if self.cancelled.is_set():
+            raise ExportCancelled()
+        self.queue.put(('progress', done, total))
+
+class VirtualTree:
+    """Shows a large row model in a ttk.Treeview without inserting every row.
+
+    Only the rows that fit on screen plus BUFFER are inserted; scrolling
+    recycles those items with the values of the rows now in view. Rows whose
+    key is in expanded are followed by their children, which are located on
+    demand instead of being flattened into a list.
+    """
+
+    BUFFER = 10
+
+    def __init__(self, tree, scrollbar, values, key=None, children=None, child_values=None):
+        self.tree = tree
+        self.scrollbar = scrollbar
+        self.values = values
+        self.key = key
+        self.children = children
+        self.child_values = child_values
+        self.rows = []
+        self.expanded = set()
+        self.top = 0            # display index of the first rendered row
+        self.items = []         # rendered item ids, top to bottom
+        self.records = {}       # item id -> (row, child or None)
+        self.selected = None
+        self.marks = []         # (display index, row index, child count) of expanded rows
+        self.starts = []
+
+        scrollbar.configure(command=self.yview)
+        tree.tag_configure('child', foreground='gray40')
+        tree.bind('<Configure>', lambda e: self.render())
+        tree.bind('<MouseWheel>', lambda e: self.scroll(-3 if e.delta > 0 else 3))
+        tree.bind('<Button-4>', lambda e: self.scroll(-3))
+        tree.bind('<Button-5>', lambda e: self.scroll(3))
+        tree.bind('<Up>', lambda e: self.move_selection(-1))
+        tree.bind('<Down>', lambda e: self.move_selection(1))
+        tree.bind('<Prior>', lambda e: self.move_selection(-self.visible_rows()))
+        tree.bind('<Next>', lambda e: self.move_selection(self.visible_rows()))
+        tree.bind('<<TreeviewSelect>>', self.on_select)
+
+    def set_rows(self, rows, top=None):
+        """Show rows (kept by reference) and re-render the visible window."""
+        self.rows = rows
+        if top is not None:
+            self.top = top
+        self.reindex()
+        self.render()
+
+    def toggle(self, row):
+        key = self.key(row)
+        if key in self.expanded:
+            self.expanded.remove(key)
         else:
-            message = f"{t} - <{victim}> {state} by {damage} damage at {health} health {source}"
-
-        combat_events.append({
-            'Type': 'Combat',
-            'Offset': off,
-            'Time': t,
-            'Victim': victim,
-            'State': state,
-            'Damage': damage,
-            'Health': health,
-            'Source': source,
-            'Message': message,
-            'Value': float(damage) if damage.replace('.', '').isdigit() else 0
-        })
-
-    # Process warnings
-    for L in lines:
-        if m := warn_rx.match(L):
-            text = m.group(2)
-            if min_keyword_filter and not re.search(r'dmg|damage', text, re.IGNORECASE):
-                continue
-            if text.strip().startswith("Cannot create"): # Skip all the cannot create warnings since sometiimes they are with damage in them and are quite spammy
-                continue
-            off = float(m.group(1))
-            warning_groups.setdefault(off, []).append(text.strip())
-
-    # Process warning groups
-    warning_list = []
-    for off, wlist in warning_groups.items():
-        if off in event_offsets:
-            continue
-            
-        group = {
-            'total': len(wlist),
-            'max_dmg': 0.0,
-            'messages': [],
-            'dmg_vals': []
-        }
-        
-        for text in wlist:
-            if m_val := re.search(r'high dmg:\s*([0-9\.eE+\-]+)', text):
-                dmg_val = float(m_val.group(1))
-                group['max_dmg'] = max(group['max_dmg'], dmg_val)
-                group['dmg_vals'].append(dmg_val)
-            group['messages'].append(text)
-
-        t_format = datetime.utcfromtimestamp if use_utc else datetime.fromtimestamp
-        t = t_format(start_time + off).strftime("%H:%M:%S")
-        
-        warning_list.append({
-            'Type': 'WarningGroup',
-            'Offset': off,
-            'Time': t,
-            'Count': group['total'],
-            'MaxDamage': group['max_dmg'],
-            'Messages': group['messages'],
-            'Children': [{
-                'Offset': off,
-                'Time': t,
-                'Message': msg,
-                'Damage': f"{group['dmg_vals'][idx]:.2e}" if idx < len(group['dmg_vals']) else '',
-                'Value': group['dmg_vals'][idx] if idx < len(group['dmg_vals']) else 0
-            } for idx, msg in enumerate(group['messages'])]
-        })
-
-    return {
-        'Player': player_name or '',
-        'LogStart': datetime.fromtimestamp(start_time).strftime('%Y-%m-%d %H:%M:%S'),
-        'LogEnd': datetime.fromtimestamp(end_time).strftime('%Y-%m-%d %H:%M:%S'),
-        'CombatEvents': combat_events,
-        'WarningGroups': warning_list
-    }
+            self.expanded.add(key)
+        self.reindex()
+        self.render()
+
+    def record(self, item):
+        return self.records.get(item, (None, None))
+
+    def reindex(self):
+        self.marks = []
+        if self.expanded:
+            extra = 0
+            for i, row in enumerate(self.rows):
+                if self.key(row) in self.expanded:
+                    count = len(self.children(row))
+                    self.marks.append((i + extra, i, count))
+                    extra += count
+        self.starts = [m[0] for m in self.marks]
+
+    def total(self):
+        return len(self.rows) + sum(m[2] for m in self.marks)
+
+    def locate(self, index):
+        # Map a display index to (row, child or None)
+        k = bisect_right(self.starts, index) - 1
+        if k < 0:
+            return self.rows[index], None
+        start, i, count = self.marks[k]
+        if index == start:
+            return self.rows[i], None
+        if index - start <= count:
+            return self.rows[i], self.children(self.rows[i])[index - start - 1]
+        return self.rows[i + index - start - count], None
+
+    def iter_rows(self, rows=None):
+        """Yield (record, values) for every displayed row, expanded children included."""
+        for row in self.rows if rows is None else rows:
+            yield row, self.values(row)
+            if self.expanded and self.key(row) in self.expanded:
+                for child in self.children(row):
+                    yield child, self.child_values(child)
+
+    def sample_rows(self, limit):
+        """iter_rows() over an even sample of about limit rows, taken before
+        any values are formatted."""
+        step = len(self.rows) // limit
+        return self.iter_rows(self.rows[::step] if step > 1 else None)
+
+    def iter_values(self):
+        for _, values in self.iter_rows():
+            yield values
+
+    def visible_rows(self):
+        row_height = int(ttk.Style().lookup('Treeview', 'rowheight') or 20)
+        return max(1, self.tree.winfo_height() // row_height)
+
+    def render(self):
+        total = self.total()
+        height = self.visible_rows()
+        self.top = max(0, min(self.top, total - height))
+        end = min(total, self.top + height + self.BUFFER)
+
+        # Grow or shrink the pool of items, then fill it with the window
+        needed = end - self.top
+        if len(self.items) > needed:
+            self.tree.delete(*self.items[needed:])
+            del self.items[needed:]
+        while len(self.items) < needed:
+            self.items.append(self.tree.insert('', 'end'))
+
+        self.records = {}
+        selection = ()
+        for item, index in zip(self.items, range(self.top, end)):
+            row, child = self.locate(index)
+            if child is None:
+                self.tree.item(item, values=self.values(row), tags=())
+            else:
+                self.tree.item(item, values=self.child_values(child), tags=('child',))
+            self.records[item] = (row, child)
+            if self.selected == (row, child):
+                selection = (item,)
+        if tuple(self.tree.selection()) != selection:
+            self.tree.selection_set(selection)
+
+        if total:
+            self.scrollbar.set(self.top / total, min(1.0, (self.top + height) / total))
+        else:
+            self.scrollbar.set(0, 1)
+
+    def scroll(self, rows):
+        self.top += rows
+        self.render()
+        return 'break'
+
+    def yview(self, *args):
+        if args[0] == 'moveto':
+            self.top = int(float(args[1]) * self.total())
+        elif args[0] == 'scroll':
+            step = self.visible_rows() if args[2] == 'pages' else 1
+            self.top += int(args[1]) * step
+        self.render()
+
+    def on_select(self, event):
+        selection = self.tree.selection()
+        if selection and selection[0] in self.records:
+            self.selected = self.records[selection[0]]
+
+    def move_selection(self, step):
+        selection = self.tree.selection()
+        if not selection or selection[0] not in self.items:
+            return 'break'
+        index = max(0, min(self.total() - 1, self.top + self.items.index(selection[0]) + step))
+        height = self.visible_rows()
+        if index < self.top:
+            self.top = index
+        elif index >= self.top + height:
+            self.top = index - height + 1
+        self.selected = self.locate(index)
+        self.render()
+        return 'break'
+
+class ColumnSizer:
+    """Keeps the columns of a tree as wide as their widest displayed cell.
+
+    Widths are measured once per distinct string and a running maximum is
+    kept per column along with the record that produced it, so adding rows
+    only measures the new cells. A column is recomputed from the cached
+    widths only when that record leaves the view.
+    """
+
+    MAX_WIDTH = 600         # Max width cap
+    SAMPLE_LIMIT = 20000    # rows measured by a full recompute before sampling
+    CACHE_LIMIT = 200000
+
+    def __init__(self, tree, min_widths, extra=None):
+        self.tree = tree
+        self.columns = tree['columns']
+        self.font = tkfont.Font()
+        self.min_widths = min_widths
+        self.extra = extra or {}
+        self.cache = {}
+        # Strings this long can't fit under the cap whatever their glyphs
+        self.cap_chars = self.MAX_WIDTH // max(1, self.font.measure('.'))
+        self.widths = {}        # col -> (width, record)
+        self.applied = {}
+        self.reset(())
+
+    def measure(self, text):
+        text = str(text)
+        if len(text) > self.cap_chars:
+            return self.MAX_WIDTH
+        width = self.cache.get(text)
+        if width is None:
+            if len(self.cache) > self.CACHE_LIMIT:
+                self.cache.clear()
+            width = self.cache[text] = self.font.measure(text)
+        return width
+
+    def cell_width(self, col, text):
+        return self.measure(text) + 30 + self.extra.get(col, 0)
+
+    def reset(self, rows, columns=None):
+        """Recompute columns (all by default) from (record, values) pairs;
+        for long views pass a sample, see VirtualTree.sample_rows()."""
+        columns = columns or self.columns
+        for col in columns:
+            # Calculate header width
+            self.widths[col] = (self.cell_width(col, self.tree.heading(col)['text']) - self.extra.get(col, 0), None)
+        self.add(rows, columns)
+
+    def add(self, rows, columns=None):
+        """Widen columns (all by default) for newly displayed (record, values) pairs."""
+        columns = [(i, col) for i, col in enumerate(self.columns) if col in (columns or self.columns)]
+        for record, values in rows:
+            capped = True
+            for i, col in columns:
+                best = self.widths[col][0]
+                if best >= self.MAX_WIDTH:
+                    continue
+                capped = False
+                width = self.cell_width(col, values[i])
+                if width > best:
+                    self.widths[col] = (width, record)
+            if capped:
+                break
+
+    def drop(self, keep, rows):
+        """Recompute the columns whose widest record fails keep(record)."""
+        stale = [col for col, (_, record) in self.widths.items()
+                 if record is not None and not keep(record)]
+        if stale:
+            self.reset(rows, stale)
+
+    def apply(self):
+        for col in self.columns:
+            # Apply minimum width constraints, then the max width cap
+            width = min(max(self.widths[col][0], self.min_widths.get(col, 100)), self.MAX_WIDTH)
+            if self.applied.get(col) != width:
+                self.tree.column(col, width=width)
+                self.applied[col] = width
+
+def remove_latest(rows, row):
+    # Tail updates only remove groups from the last few offsets, so look for
+    # them from the end, by identity rather than through Row.__eq__
+    for k in range(len(rows) - 1, -1, -1):
+        if rows[k] is row:
+            del rows[k]
+            return
+
+class ArchiveWindow(tk.Toplevel):
+    """Query view over the session archive.
+
+    A canned query from QUERIES fills the SQL box, which can be edited
+    before running; :since, :limit and :min_damage are bound from the
+    fields. Results are shown in a VirtualTree, so unlimited queries stay
+    responsive.
+    """
+
+    def __init__(self, master, archive):
+        super().__init__(master)
+        self.title(f'Session Archive - {archive.path}')
+        self.geometry('1000x600')
+        self.archive = archive
+
+        controls = ttk.Frame(self)
+        controls.pack(fill='x', padx=5, pady=5)
+        self.query_var = tk.StringVar(value='sessions')
+        query_box = ttk.Combobox(controls, textvariable=self.query_var, values=list(QUERIES),
+                                 state='readonly', width=14)
+        query_box.pack(side='left', padx=2)
+        query_box.bind('<<ComboboxSelected>>', lambda e: self.show_query())
+        self.days_var = tk.StringVar(value='90')
+        self.limit_var = tk.StringVar(value='20')
+        self.min_damage_var = tk.StringVar(value='1e9')
+        for label, var in (('Days', self.days_var), ('Limit', self.limit_var),
+                           ('Min damage', self.min_damage_var)):
+            ttk.Label(controls, text=label).pack(side='left', padx=(8, 2))
+            ttk.Entry(controls, textvariable=var, width=8).pack(side='left')
+        ttk.Button(controls, text='Run', command=self.run_query).pack(side='left', padx=8)
+        ttk.Button(controls, text='Add Current Log', command=self.add_current_log).pack(side='right', padx=2)
+
+        self.sql_text = tk.Text(self, height=7, font='TkFixedFont', wrap='none')
+        self.sql_text.pack(fill='x', padx=5)
+
+        frame = ttk.Frame(self)
+        frame.pack(fill='both', expand=True)
+        self.tree = ttk.Treeview(frame, show='headings')
+        scroll = ttk.Scrollbar(frame, orient='vertical')
+        scroll.pack(side='right', fill='y', pady=5)
+        self.tree.pack(fill='both', expand=True, padx=5, pady=5)
+        self.view = VirtualTree(self.tree, scroll, tuple)
+
+        self.status_var = tk.StringVar()
+        ttk.Label(self, textvariable=self.status_var, padding=5).pack(fill='x')
+
+        self.protocol('WM_DELETE_WINDOW', self.close)
+        self.show_query()
+        self.run_query()
+
+    def close(self):
+        self.archive.close()
+        self.destroy()
+
+    def show_query(self):
+        self.sql_text.delete('1.0', 'end')
+        self.sql_text.insert('1.0', textwrap.dedent(QUERIES[self.query_var.get()]).strip())
+
+    def params(self):
+        days, limit, min_damage = (var.get().strip() for var in
+                                   (self.days_var, self.limit_var, self.min_damage_var))
+        return query_params(float(days) if days else None, int(limit) if limit else 0,
+                            float(min_damage) if min_damage else 0.0)
+
+    def run_query(self):
+        try:
+            columns, rows = self.archive.query(self.sql_text.get('1.0', 'end').strip(), self.params())
+        except (ValueError, sqlite3.Error) as e:
+            messagebox.showerror('Query Failed', str(e), parent=self)
+            return
+
+        # Column ids are positional since raw SQL may repeat a name
+        self.view.set_rows([], top=0)
+        ids = [f'c{i}' for i in range(len(columns))]
+        self.tree.configure(columns=ids)
+        for col, name in zip(ids, columns):
+            self.tree.heading(col, text=name, anchor='w')
+            self.tree.column(col, width=100, anchor='w', stretch=True)
+        self.view.set_rows(rows, top=0)
+        sizer = ColumnSizer(self.tree, {})
+        sizer.reset(self.view.sample_rows(sizer.SAMPLE_LIMIT))
+        sizer.apply()
+        self.status_var.set(f'{len(rows)} rows')
+
+    def add_current_log(self):
+        gui = self.master
+        if gui.parser is None:
+            messagebox.showinfo('Archive', 'No log loaded to add.', parent=self)
+            return
+        if gui.worker:
+            messagebox.showinfo('Archive', 'Wait for the log to finish parsing.', parent=self)
+            return
+        self.configure(cursor='watch')
+        self.update_idletasks()
+        try:
+            if any(gui.parser.retired.values()):
+                # Live mode moved rows out of the parser: archive the file
+                self.archive.ingest(gui.current_path, gui.parser.min_keyword_filter, force=True)
+            else:
+                self.archive.ingest_parser(gui.parser)
+        except (OSError, ValueError, sqlite3.Error) as e:
+            messagebox.showerror('Archive', f'Failed to archive log:\n{e}', parent=self)
+        finally:
+            self.configure(cursor='')
+        self.run_query()
+
+class OlderRowsWindow(tk.Toplevel):
+    """Rows of one tab that live mode moved to disk and that match a
+    filter, as found by LogReaderGUI.search_spill()."""
+
+    def __init__(self, master, tab, query, rows):
+        super().__init__(master)
+        self.title(f"Older Rows - {query or 'all'}")
+        self.geometry('1000x600')
+        limit = master.SPILL_SEARCH_LIMIT
+        frame = ttk.Frame(self)
+        frame.pack(fill='both', expand=True)
+        source = master.combat_tree if tab == 'combat' else master.analysis_tree
+        self.tree = ttk.Treeview(frame, columns=source['columns'], show='headings')
+        for col in source['columns']:
+            self.tree.heading(col, text=col, anchor='w')
+            self.tree.column(col, width=100, anchor='w', stretch=True)
+        scroll = ttk.Scrollbar(frame, orient='vertical')
+        scroll.pack(side='right', fill='y', pady=5)
+        self.tree.pack(fill='both', expand=True, padx=5, pady=5)
+        self.view = VirtualTree(self.tree, scroll,
+                                master.combat_values if tab == 'combat' else master.group_values)
+        self.view.set_rows(rows[:limit], top=0)
+        sizer = ColumnSizer(self.tree, {})
+        sizer.reset(self.view.sample_rows(sizer.SAMPLE_LIMIT))
+        sizer.apply()
+        status = f'first {limit} matching rows' if len(rows) > limit else f'{len(rows)} matching rows'
+        ttk.Label(self, text=status, padding=5).pack(fill='x')
 
 class LogReaderGUI(TkinterDnD.Tk):
     def __init__(self):
@@ -157,13 +566,26 @@ class LogReaderGUI(TkinterDnD.Tk):
         self.title('Warframe EE.log Analyzer')
         self.geometry('1400x800')
         self.current_path = None
+        self.parser = None
+        self.worker = None
+        self.exporter = None
+        self.rules = None
+        self.cache = ParseCache()
+        self.timer = PhaseTimer(enabled=False)
+        self.archive_window = None
         self.log_data = {}
-        self.last_mtime = 0
-        self.expanded_groups = set()
+        self.watcher = None
+        self.pending_change = None
         self.sort_info = {'combat': None, 'warnings': None}
         self.filter_info = {'combat': '', 'warnings': ''}
+        self.indexes = {'combat': SearchIndex(COMBAT_SEARCH), 'warnings': SearchIndex(WARNING_SEARCH)}
+        self.retention = (None, None)   # (minutes, rows) kept in memory in live mode
+        self.spill = None
+        self.filter_id = None
         self.original_rows = {'combat': [], 'warnings': []}
         self.current_rows = {'combat': [], 'warnings': []}
+        self.stats = SessionStats()
+        self.stats_dirty = False
 
         self.create_widgets()
         self.setup_bindings()
@@ -185,9 +607,12 @@ class LogReaderGUI(TkinterDnD.Tk):
         )
         
         for col in ('Target', 'Health', 'Source', 'Damage', 'Time'):
-            self.combat_tree.heading(col, text=col)
+            self.combat_tree.heading(col, text=col, command=lambda c=col: self.sort_by('combat', c))
             self.combat_tree.column(col, width=50, anchor='w', stretch=True)
+        combat_scroll = ttk.Scrollbar(self.combat_frame, orient='vertical')
+        combat_scroll.pack(side='right', fill='y', pady=5)
         self.combat_tree.pack(fill='both', expand=True, padx=5, pady=5)
+        self.combat_view = VirtualTree(self.combat_tree, combat_scroll, self.combat_values)
 
         # Damage Analysis Tab
         self.analysis_frame = ttk.Frame(self.notebook)
@@ -205,17 +630,51 @@ class LogReaderGUI(TkinterDnD.Tk):
         }
         
         for col, config in analysis_columns.items():
-            self.analysis_tree.heading(col, text=col, anchor=config['anchor'])
+            self.analysis_tree.heading(col, text=col, anchor=config['anchor'],
+                command=lambda c=col: self.sort_by('warnings', c))
             self.analysis_tree.column(col, 
                 width=config['width'],
                 anchor=config['anchor'],
                 stretch=True
             )
         
+        analysis_scroll = ttk.Scrollbar(self.analysis_frame, orient='vertical')
+        analysis_scroll.pack(side='right', fill='y', pady=5)
         self.analysis_tree.pack(fill='both', expand=True, padx=5, pady=5)
+        self.analysis_view = VirtualTree(self.analysis_tree, analysis_scroll, self.group_values,
+            key=lambda group: group['Offset'],
+            children=lambda group: group['Children'],
+            child_values=self.child_values
+        )
         
+        self.views = {'combat': self.combat_view, 'warnings': self.analysis_view}
+        min_widths = {
+            'Time': 120,
+            'MaxDamage': 140,
+            'Count': 80,
+            'Messages': 200  # Base width for messages
+        }
+        self.sizers = {
+            'combat': ColumnSizer(self.combat_tree, min_widths),
+            # Extra space for right-aligned numbers
+            'warnings': ColumnSizer(self.analysis_tree, min_widths, extra={'MaxDamage': 20})
+        }
+
+        # Statistics Tab: sections of name/value rows, redrawn from self.stats
+        self.stats_frame = ttk.Frame(self.notebook)
+        self.stats_tree = ttk.Treeview(self.stats_frame, columns=('Value',), show='tree headings')
+        self.stats_tree.heading('#0', text='Statistic', anchor='w')
+        self.stats_tree.heading('Value', text='Value', anchor='w')
+        self.stats_tree.column('#0', width=420, anchor='w', stretch=True)
+        self.stats_tree.column('Value', width=600, anchor='w', stretch=True)
+        stats_scroll = ttk.Scrollbar(self.stats_frame, orient='vertical', command=self.stats_tree.yview)
+        self.stats_tree.configure(yscrollcommand=stats_scroll.set)
+        stats_scroll.pack(side='right', fill='y', pady=5)
+        self.stats_tree.pack(fill='both', expand=True, padx=5, pady=5)
+
         self.notebook.add(self.combat_frame, text='Death Log')
         self.notebook.add(self.analysis_frame, text='Damage Analysis')
+        self.notebook.add(self.stats_frame, text='Statistics')
         self.notebook.pack(fill='both', expand=True)
 
         # Control Panel
@@ -231,15 +690,46 @@ class LogReaderGUI(TkinterDnD.Tk):
         ttk.Button(control_frame, text='Refresh', command=self.refresh).pack(side='left', padx=5)
         self.auto_refresh_var = tk.BooleanVar()
         ttk.Checkbutton(control_frame, text='Auto-Refresh', variable=self.auto_refresh_var).pack(side='left', padx=5)
+        # Retention while auto-refreshing: older rows move to disk
+        ttk.Label(control_frame, text='Keep').pack(side='left')
+        self.keep_var = tk.StringVar(value='All')
+        keep_box = ttk.Combobox(control_frame, textvariable=self.keep_var, values=self.RETENTION_CHOICES, width=11)
+        keep_box.pack(side='left', padx=(2, 5))
+        keep_box.bind('<<ComboboxSelected>>', lambda e: self.set_retention())
+        keep_box.bind('<Return>', lambda e: self.set_retention())
         self.utc_var = tk.BooleanVar()
         ttk.Checkbutton(control_frame, text='UTC', variable=self.utc_var, command=self.toggle_utc).pack(side='left', padx=5)
+        ttk.Button(control_frame, text='Archive', command=self.open_archive).pack(side='left', padx=5)
+        self.timings_var = tk.BooleanVar()
+        ttk.Checkbutton(control_frame, text='Timings', variable=self.timings_var,
+                        command=self.toggle_timings).pack(side='left', padx=5)
+
+        # Parse progress, shown while a worker is running
+        self.progress_var = tk.StringVar()
+        self.progress_bar = ttk.Progressbar(control_frame, length=150, mode='determinate')
+        self.progress_label = ttk.Label(control_frame, textvariable=self.progress_var, width=22)
+
+        # Export progress, shown while an export is running
+        self.export_var = tk.StringVar()
+        self.export_bar = ttk.Progressbar(control_frame, length=150, mode='determinate')
+        self.export_label = ttk.Label(control_frame, textvariable=self.export_var, width=22)
+        self.export_cancel = ttk.Button(control_frame, text='Cancel Export', command=self.cancel_export)
         
         # Context menu
         self.context_menu = tk.Menu(self, tearoff=0)
         self.context_menu.add_command(label="Copy Row", command=self.copy_row)
-        self.context_menu.add_command(label="Export to CSV...", command=self.export_csv)
+        self.context_menu.add_command(label="Export View...", command=lambda: self.export_rows('view'))
+        self.context_menu.add_command(label="Export All Rows...", command=lambda: self.export_rows('all'))
+        self.context_menu.add_command(label="Search Older Rows...", command=self.search_spill)
         self.context_menu.add_separator()
         self.context_menu.add_command(label="Open Log File", command=self.open_in_editor)
+        self.context_menu.add_command(label="Load Rules...", command=self.choose_rules)
+        self.context_menu.add_separator()
+        self.context_menu.add_command(label="Export Timings...", command=self.export_timings)
+        self.context_menu.add_command(label="Profile Reload (cProfile)",
+                                      command=lambda: self.profile_reload('cprofile'))
+        self.context_menu.add_command(label="Profile Reload (memory)",
+                                      command=lambda: self.profile_reload('tracemalloc'))
 
     def setup_bindings(self):
         self.drop_target_register(DND_FILES)
@@ -247,10 +737,13 @@ class LogReaderGUI(TkinterDnD.Tk):
         self.combat_tree.bind('<Button-3>', self.show_context_menu)
         self.analysis_tree.bind('<Button-3>', self.show_context_menu)
         self.analysis_tree.bind('<Double-1>', self.toggle_warning_group)
-        self.filter_var.trace_add('write', self.apply_filter)
+        self.notebook.bind('<<NotebookTabChanged>>', lambda e: self.stats_dirty and self.update_stats())
+        self.filter_var.trace_add('write', self.schedule_filter)
         self.auto_refresh_var.trace_add('write', lambda *_: self.toggle_auto_refresh())
 
     def load_default_log(self):
+        if default_rules_path().exists():
+            self.read_rules(default_rules_path())
         localappdata = os.getenv('LOCALAPPDATA', '')
         if not localappdata:
             messagebox.showerror("Error", "%LOCALAPPDATA% environment variable not found!")
@@ -272,148 +765,205 @@ class LogReaderGUI(TkinterDnD.Tk):
                 "Drag & drop a log file or use File > Open."
             )
 
-    def update_display(self):
-        self.summary_var.set(
+    # Phases shown in the summary bar while timings are on
+    SUMMARY_PHASES = ('load', 'parse', 'read', 'match', 'events', 'warnings',
+                      'index', 'stats', 'retire', 'display', 'format', 'resize', 'filter', 'sort')
+
+    def update_summary(self):
+        summary = (
             f"Player: {self.log_data.get('Player', 'N/A')} | "
             f"Start: {self.log_data.get('LogStart', 'N/A')} | "
             f"End: {self.log_data.get('LogEnd', 'N/A')}"
         )
+        if self.parser and (matches := len(self.parser.match_events) + self.parser.retired['Matches']):
+            summary += f" | Rule matches: {matches}"
+        if self.spill and self.spill.total():
+            older = self.spill.counts['CombatEvents'] + self.spill.counts['WarningGroups']
+            summary += f" | Older rows on disk: {older:,}"
+        if self.timer.enabled:
+            summary += f" | {self.timer.summary(self.SUMMARY_PHASES) or 'no timings yet'}"
+        self.summary_var.set(summary)
 
-        # combat log with detailed columns
-        self.combat_tree.delete(*self.combat_tree.get_children())
-        for event in self.current_rows['combat']:
-            self.combat_tree.insert('', 'end', values=(
-                event['Victim'],          # Target
-                event['Health'],          # Health
-                event['Source'],          # Source (who + what)
-                event['Damage'],          # Damage
-                event['Time']             # Time
-            ))
-
-        self.analysis_tree.delete(*self.analysis_tree.get_children())
-        for group in self.current_rows['warnings']:
-            parent = self.analysis_tree.insert('', 'end', values=(
-                group['Time'],
-                f"{group['MaxDamage']:.2e}",
-                group['Count'],
-                '; '.join(group['Messages'][:3]) + ('...' if len(group['Messages']) > 3 else '')
-            ))
-            if group['Offset'] in self.expanded_groups:
-                for child in group['Children']:
-                    self.analysis_tree.insert(parent, 'end', values=(
-                        child['Time'],
-                        child['Damage'],
-                        '',
-                        child['Message']
-                    ))
+    @staticmethod
+    def combat_values(event):
+        return (
+            event['Victim'],          # Target
+            event['Health'],          # Health
+            event['Source'],          # Source (who + what)
+            event['Damage'],          # Damage
+            event['Time']             # Time
+        )
 
-        self.auto_resize_columns()
+    @staticmethod
+    def group_values(group):
+        return (
+            group['Time'],
+            f"{group['MaxDamage']:.2e}",
+            group['Count'],
+            '; '.join(group['Messages'][:3]) + ('...' if len(group['Messages']) > 3 else '')
+        )
+
+    @staticmethod
+    def child_values(child):
+        return (
+            child['Time'],
+            child['Damage'],
+            '',
+            child['Message']
+        )
+
+    def update_display(self, top=None):
+        with self.timer.phase('display'), self.timed_clock():
+            self.combat_view.set_rows(self.current_rows['combat'], top)
+            self.analysis_view.set_rows(self.current_rows['warnings'], top)
+        self.update_summary()
+
+    HISTOGRAM_WIDTH = 40    # characters of the longest histogram bar
+
+    def update_stats(self):
+        # The aggregates are always current; the tab is only redrawn while
+        # it is showing, and once when it is next selected otherwise
+        if self.current_tab() != 'stats':
+            self.stats_dirty = True
+            return
+        self.stats_dirty = False
+        with self.timer.phase('display'):
+            stats = self.stats.snapshot()
+            tree = self.stats_tree
+            closed = {tree.item(item, 'text') for item in tree.get_children() if not tree.item(item, 'open')}
+            tree.delete(*tree.get_children())
+            minute = lambda m: self.parser.clock(m * 60) if self.parser else f'minute {m}'
+            number = lambda value: '-' if value is None else f'{value:.3g}'
+
+            def section(title, rows):
+                parent = tree.insert('', 'end', text=title, open=title not in closed)
+                for name, value in rows:
+                    tree.insert(parent, 'end', text=name, values=(value,))
+
+            section('Combat events', [('Events', stats['Events'])] + list(stats['States'].items()) + [
+                ('Events per minute', f"{stats['PerMinute']:.2f}"),
+                ('Busiest minute', f"{minute(stats['PeakMinute'][0])}: {stats['PeakMinute'][1]}"
+                 if stats['PeakMinute'] else '-'),
+            ] + [(f'Minute at {minute(m)}', n) for m, n in stats['RecentMinutes']])
+            section('Damage', [('Max', number(stats['MaxDamage']))] + [
+                (f'p{q * 100:g}', number(value)) for q, value in stats['Percentiles'].items()])
+            largest = max((n for _, n in stats['Histogram']), default=0) or 1
+            section('Damage histogram', [
+                (f'1e{d} - 1e{d + 1}', f"{n:>8}  {'█' * max(1, round(n * self.HISTOGRAM_WIDTH / largest))}")
+                for d, n in stats['Histogram']] + [('No damage value', stats['ZeroDamage'])])
+            section('Victims', [
+                (victim, ' / '.join(f'{n} {state}' for state, n in counts.items()))
+                for victim, counts in stats['Victims']])
+            section('Top sources by max damage', [
+                (source or '(unknown)', f'{number(peak)} in {hits} hits') for source, peak, hits in stats['TopByMax']])
+            section('Top sources by total damage', [
+                (source or '(unknown)', f'{number(total)} in {hits} hits') for source, total, hits in stats['TopByTotal']])
+            section('Warnings', [('Groups', stats['WarningGroups']), ('Messages', stats['WarningMessages'])] + [
+                (f'Max damage p{q * 100:g}', number(value)) for q, value in stats['WarningPercentiles'].items()])
+
+    def timed_clock(self):
+        # Times are formatted while rows are drawn, through the stores' clock
+        stack = ExitStack()
+        if self.parser:
+            for store in (self.parser.combat, self.parser.warnings):
+                stack.enter_context(self.timer.instrument(store, {'clock': 'format'}))
+        return stack
+
+    def auto_resize_columns(self, tabs=('combat', 'warnings')):
+        # Cells measured before come from the cache, so this costs no Tk calls
+        # for rows that were already on screen
+        with self.timer.phase('resize'):
+            for tab in tabs:
+                view = self.views[tab]
+                self.sizers[tab].reset(view.sample_rows(ColumnSizer.SAMPLE_LIMIT))
+                self.sizers[tab].apply()
+        if self.timer.enabled:
+            self.update_summary()
+
+    def resize_for_rows(self, tab, rows):
+        # Widen the columns of tab for rows that just came into view
+        self.sizers[tab].add(self.views[tab].iter_rows(rows))
+        self.sizers[tab].apply()
+
+    def resize_without(self, tab, keep):
+        # Narrow the columns of tab if their widest row left the view
+        view = self.views[tab]
+        self.sizers[tab].drop(keep, view.sample_rows(ColumnSizer.SAMPLE_LIMIT))
+        self.sizers[tab].apply()
+
+    def current_tab(self):
+        return ('combat', 'warnings', 'stats')[self.notebook.index("current")]
+
+    def row_matches(self, tab, row):
+        return not self.filter_info[tab] or self.indexes[tab].matches(row)
+
+    FILTER_DELAY = 200  # ms of typing pause before the filter runs
+
+    def schedule_filter(self, *args):
+        if self.filter_id:
+            self.after_cancel(self.filter_id)
+        self.filter_id = self.after(self.FILTER_DELAY, self.apply_filter)
 
-    def auto_resize_columns(self):
-        def resize_tree(tree):
-            font = tkfont.Font()
-            min_widths = {
-                'Time': 120,
-                'MaxDamage': 140,
-                'Count': 80,
-                'Messages': 200  # Base width for messages
-            }
-            
-            for col in tree['columns']:
-                # Calculate header width
-                header_text = tree.heading(col)['text']
-                max_w = font.measure(header_text) + 30
-                
-                # Check all items (including children of expanded groups)
-                def check_children(parent):
-                    for item in tree.get_children(parent):
-                        # Check the item itself
-                        cell_value = tree.set(item, col)
-                        cell_width = font.measure(cell_value) + 30
-                        if col == 'MaxDamage' and tree.heading(col)['anchor'] == 'e':
-                            cell_width += 20  # Extra space for right-aligned numbers
-                        nonlocal max_w
-                        max_w = max(max_w, cell_width)
-                        
-                        # Recursively check children if expanded
-                        if tree.exists(item) and tree.item(item, 'open'):
-                            check_children(item)
-                
-                # Start with root items
-                check_children('')
-                
-                # Apply minimum width constraints
-                min_w = min_widths.get(col, 100)
-                max_w = max(max_w, min_w)
-                
-                # Set column width with constraints
-                tree.column(col, width=min(max_w, 600))  # Max width cap
-
-        resize_tree(self.combat_tree)
-        resize_tree(self.analysis_tree)
-        
     def apply_filter(self, *args):
-        current_tab = 'combat' if self.notebook.index("current") == 0 else 'warnings'
+        self.filter_id = None
+        current_tab = self.current_tab()
+        if current_tab not in self.indexes:
+            return
+        previous = self.indexes[current_tab].terms
         self.filter_info[current_tab] = self.filter_var.get().lower()
-        
-        filtered = []
-        for row in self.original_rows[current_tab]:
-            if current_tab == 'combat':
-                # Search across all relevant combat fields
-                match_fields = ['Victim', 'Health', 'Source', 'Damage']
-                search_text = [
-                    str(row['Victim']).lower(),
-                    str(row['Health']).lower(),
-                    str(row['Source']).lower(),
-                    str(row['Damage']).lower()
-                ]
-            else:
-                match_fields = ['Messages']
-            
-            if any(self.filter_info[current_tab] in str(row.get(field, '')).lower() 
-                   for field in match_fields):
-                filtered.append(row)
-        
-        self.current_rows[current_tab] = filtered
+        with self.timer.phase('filter'):
+            self.indexes[current_tab].search(self.filter_info[current_tab])
         self.sort_and_display(current_tab)
+        if self.filter_info[current_tab] and all(
+                any(SearchIndex.implies(new, old) for new in self.indexes[current_tab].terms)
+                for old in previous):
+            # A narrower query only hides rows
+            self.resize_without(current_tab, lambda row: self.row_matches(current_tab, row))
+        else:
+            self.auto_resize_columns([current_tab])
 
     def clear_filter(self):
         self.filter_var.set('')
-        self.current_rows = {k: v.copy() for k, v in self.original_rows.items()}
-        self.update_display()
+        for tab, index in self.indexes.items():
+            self.filter_info[tab] = ''
+            index.search('')
+            self.sort_rows(tab)
+        self.update_display(top=0)
+        self.auto_resize_columns()
+
+    def sort_rows(self, tab):
+        # Filtered rows in the cached order of the sort column
+        with self.timer.phase('sort'):
+            self.current_rows[tab] = self.indexes[tab].ordered(self.sort_info[tab])
+
+    def sort_by(self, tab, col):
+        # Clicking the sorted column again flips the direction
+        current = self.sort_info[tab]
+        self.sort_info[tab] = (col, not current[1] if current and current[0] == col else False)
+        self.update_headings(tab)
+        self.sort_and_display(tab)
+
+    def update_headings(self, tab):
+        tree = self.combat_tree if tab == 'combat' else self.analysis_tree
+        sort = self.sort_info[tab]
+        for col in tree['columns']:
+            arrow = (' \u25bc' if sort[1] else ' \u25b2') if sort and sort[0] == col else ''
+            tree.heading(col, text=col + arrow)
 
     def sort_and_display(self, tab):
-        if self.sort_info[tab]:
-            col, reverse = self.sort_info[tab]
-            key_map = {
-                'combat': {'Value': 'Value', 'Damage': 'Value'},
-                'warnings': {'MaxDamage': 'MaxDamage', 'Count': 'Count'}
-            }
-            key = key_map[tab].get(col, col)
-            self.current_rows[tab].sort(key=lambda x: x.get(key, 0), reverse=reverse)
-        self.update_display()
+        self.sort_rows(tab)
+        self.update_display(top=0)
 
     def toggle_warning_group(self, event):
         item = self.analysis_tree.identify_row(event.y)
-        if item and self.analysis_tree.exists(item):
-            values = self.analysis_tree.item(item, 'values')
-            if values[2]:
-                offset = next((g['Offset'] for g in self.current_rows['warnings'] 
-                             if g['Time'] == values[0] and g['Count'] == int(values[2])), None)
-                if offset:
-                    if offset in self.expanded_groups:
-                        self.expanded_groups.remove(offset)
-                        self.analysis_tree.delete(*self.analysis_tree.get_children(item))
-                    else:
-                        self.expanded_groups.add(offset)
-                        group = next(g for g in self.current_rows['warnings'] if g['Offset'] == offset)
-                        for child in group['Children']:
-                            self.analysis_tree.insert(item, 'end', values=(
-                                child['Time'],
-                                child['Damage'],
-                                '',
-                                child['Message']
-                            ))
+        group, child = self.analysis_view.record(item)
+        if group and child is None:
+            self.analysis_view.toggle(group)
+            if group['Offset'] in self.analysis_view.expanded:
+                self.resize_for_rows('warnings', [group])
+            else:
+                children = set(group['Children'])
+                self.resize_without('warnings', lambda row: row not in children)
 
     def show_context_menu(self, event):
         try:
@@ -424,52 +974,197 @@ class LogReaderGUI(TkinterDnD.Tk):
             self.context_menu.grab_release()
 
     def copy_row(self):
-        current_tab = 'combat' if self.notebook.index("current") == 0 else 'warnings'
-        tree = self.combat_tree if current_tab == 'combat' else self.analysis_tree
+        current_tab = self.current_tab()
+        tree = {'combat': self.combat_tree, 'warnings': self.analysis_tree, 'stats': self.stats_tree}[current_tab]
         selected = tree.selection()
         if selected:
             item = selected[0]
             values = tree.item(item, 'values')
+            if current_tab == 'stats':
+                values = (tree.item(item, 'text'),) + tuple(values)
             self.clipboard_clear()
-            self.clipboard_append('\t'.join(values))
+            self.clipboard_append('\t'.join(map(str, values)))
 
-    def export_csv(self):
-        current_tab = 'combat' if self.notebook.index("current") == 0 else 'warnings'
-        tree = self.combat_tree if current_tab == 'combat' else self.analysis_tree
-        path = filedialog.asksaveasfilename(defaultextension=".csv", filetypes=[("CSV Files", "*.csv")])
-        if path:
-            with open(path, 'w', encoding='utf-8') as f:
-                headers = tree['columns']
-                f.write(','.join(headers) + '\n')
-                for item in tree.get_children():
-                    f.write(','.join(tree.item(item, 'values')) + '\n')
+    EXPORT_FORMATS = {'.ndjson': 'ndjson', '.jsonl': 'ndjson'}  # anything else is CSV
+
+    def export_rows(self, scope):
+        # 'view' exports the current tab as filtered and sorted, 'all' every row
+        if self.exporter:
+            messagebox.showinfo('Export', 'An export is already running.')
+            return
+        tab = self.current_tab()
+        if tab not in self.views:
+            messagebox.showinfo('Export', 'Only the Death Log and Damage Analysis tabs can be exported.')
+            return
+        path = filedialog.asksaveasfilename(defaultextension=".csv",
+                                            filetypes=[("CSV Files", "*.csv"), ("NDJSON Files", "*.ndjson")])
+        if not path:
+            return
+        # Tail updates change these lists in place, so the worker gets a copy
+        rows = list(self.current_rows[tab] if scope == 'view' else self.original_rows[tab])
+        total = len(rows)
+        kind = self.SPILL_KINDS[tab]
+        if scope == 'all' and self.spill and self.spill.counts[kind]:
+            # Rows retired from memory come first; ones retired meanwhile
+            # are still in the copy
+            older = self.spill.counts[kind]
+            rows, total = chain(self.spill.rows(kind, self.parser.clock, older), rows), total + older
+        if tab == 'combat':
+            record, columns = combat_record, COMBAT_COLUMNS
+        else:
+            record, columns = warning_record, WARNING_COLUMNS
+        fmt = self.EXPORT_FORMATS.get(os.path.splitext(path)[1].lower(), 'csv')
+        self.exporter = ExportWorker(path, rows, record, fmt, columns, total)
+        self.exporter.start()
+        self.show_export_progress(0, total)
+        self.poll_exporter(self.exporter)
+
+    def cancel_export(self):
+        if self.exporter:
+            self.exporter.cancel()
+            self.exporter = None
+            self.hide_export_progress()
+
+    def poll_exporter(self, worker):
+        if worker is not self.exporter:
+            return
+        try:
+            while True:
+                kind, *payload = worker.queue.get_nowait()
+                if kind == 'progress':
+                    self.show_export_progress(*payload)
+                    continue
+                self.exporter = None
+                self.hide_export_progress()
+                if kind == 'error':
+                    messagebox.showerror('Error', f'Failed to export:\n{payload[0]}')
+                return
+        except queue.Empty:
+            pass
+        self.after(100, self.poll_exporter, worker)
+
+    def show_export_progress(self, done, total):
+        if not self.export_bar.winfo_ismapped():
+            self.export_cancel.pack(side='right', padx=5)
+            self.export_label.pack(side='right', padx=5)
+            self.export_bar.pack(side='right', padx=5)
+        self.export_bar.configure(maximum=max(total, 1), value=done)
+        self.export_var.set(f"Export {done:,} / {total:,} rows")
+
+    def hide_export_progress(self):
+        self.export_bar.pack_forget()
+        self.export_label.pack_forget()
+        self.export_cancel.pack_forget()
+
+    RETENTION_CHOICES = ('All', '15 min', '60 min', '240 min', '20000 rows', '100000 rows')
+
+    def set_retention(self):
+        try:
+            self.retention = parse_retention(self.keep_var.get())
+        except ValueError as e:
+            messagebox.showerror('Keep', str(e))
+            return
+        self.retire_rows()
+
+    SPILL_SEARCH_LIMIT = 10000  # older rows shown per search
+
+    def search_spill(self):
+        # Run the filter over the rows on disk, a batch at a time
+        tab = self.current_tab()
+        kind = self.SPILL_KINDS[tab]
+        if not (self.spill and kind and self.spill.counts[kind]):
+            messagebox.showinfo('Older Rows', 'No older rows of this tab are on disk.')
+            return
+        query = self.filter_var.get()
+        found = []
+        self.configure(cursor='watch')
+        self.update_idletasks()
+        rows = self.spill.rows(kind, self.parser.clock)
+        try:
+            while len(found) <= self.SPILL_SEARCH_LIMIT and (batch := list(islice(rows, 4096))):
+                index = SearchIndex(SEARCH_SPECS[tab]).add(batch)
+                index.search(query)
+                found += index.ordered()
+        finally:
+            rows.close()
+            self.configure(cursor='')
+        OlderRowsWindow(self, tab, query, found)
 
     def toggle_auto_refresh(self):
         if self.auto_refresh_var.get():
-            self.schedule_auto_refresh()
+            self.start_watching()
         else:
-            self.cancel_auto_refresh()
+            self.stop_watching()
+            if self.parser and self.parser.pending and not self.worker:
+                # Nothing more is coming: show the partial line held back
+                self.start_worker(ParseWorker(self.parser, timer=self.timer, final=True))
 
-    def cancel_auto_refresh(self):
-        if hasattr(self, 'auto_refresh_id'):
-            self.after_cancel(self.auto_refresh_id)
-            del self.auto_refresh_id
+    WATCH_POLL = 50  # ms between checks of the watcher's queue
 
-    def schedule_auto_refresh(self):
-        try:
-            if self.auto_refresh_var.get() and self.current_path:
-                current_mtime = os.path.getmtime(self.current_path)
-                if current_mtime > self.last_mtime:
-                    self.last_mtime = current_mtime
-                    self.load_log(self.current_path)
-                self.auto_refresh_id = self.after(2000, self.schedule_auto_refresh)
-        except Exception as e:
-            messagebox.showerror('Refresh Error', f'Auto-refresh failed: {e}')
-            self.cancel_auto_refresh()
+    def start_watching(self):
+        # The watcher thread waits on the file; Tk only drains its queue
+        self.stop_watching()
+        if self.current_path and self.parser:
+            try:
+                self.watcher = LogWatcher(self.current_path, known_size=self.parser.position)
+            except OSError as e:
+                messagebox.showerror('Refresh Error', f'Auto-refresh failed: {e}')
+                return
+            self.watcher.start()
+            self.poll_watcher(self.watcher)
+
+    def stop_watching(self):
+        if self.watcher:
+            self.watcher.stop()
+            self.watcher = None
+        self.pending_change = None
+
+    def poll_watcher(self, watcher):
+        if watcher is not self.watcher:
+            return
+        while True:
+            try:
+                kind, _ = watcher.queue.get_nowait()
+            except queue.Empty:
+                break
+            # A restart outranks growth; a missing file waits to reappear
+            if kind in ('truncated', 'replaced'):
+                self.pending_change = 'restart'
+            elif kind == 'grown' and self.pending_change is None:
+                self.pending_change = 'grown'
+        if self.pending_change and not self.worker:
+            change, self.pending_change = self.pending_change, None
+            if change == 'restart':
+                # The game started a new session in the file: parse it afresh
+                self.load_log(self.current_path)
+                return
+            self.tail_log()
+        self.after(self.WATCH_POLL, self.poll_watcher, watcher)
+
+    def toggle_timings(self):
+        self.timer.enabled = self.timings_var.get()
+        self.timer.reset()
+        self.update_summary()
+
+    def export_timings(self):
+        path = filedialog.asksaveasfilename(defaultextension=".json", filetypes=[("JSON Files", "*.json")])
+        if path:
+            self.timer.save(path, file=str(self.current_path) if self.current_path else None,
+                            enabled=self.timer.enabled)
+
+    def profile_reload(self, kind):
+        if not self.current_path:
+            messagebox.showinfo('Profile', 'No file loaded to profile.')
+            return
+        # The profile lands in the exported timings
+        self.timer.capture = kind
+        self.load_log(self.current_path)
 
     def toggle_utc(self):
-        if self.current_path:
-            self.load_log(self.current_path)
+        # Times are formatted when rows are drawn, so just redraw them
+        if self.parser:
+            self.parser.clock.use_utc = self.utc_var.get()
+            self.update_display()
 
     def open_in_editor(self):
         if self.current_path:
@@ -488,6 +1183,20 @@ class LogReaderGUI(TkinterDnD.Tk):
         if path:
             self.load_log(path)
 
+    def read_rules(self, path):
+        try:
+            self.rules = load_rules(path)
+        except (OSError, ValueError) as e:
+            messagebox.showerror('Error', f'Failed to load rules from {path}:\n{e}')
+            return False
+        return True
+
+    def choose_rules(self):
+        # New rules change what the log parses into, so reload it
+        path = filedialog.askopenfilename(filetypes=[('Rule files', '*.toml *.json'), ('All', '*')])
+        if path and self.read_rules(path) and self.current_path:
+            self.load_log(self.current_path)
+
     def refresh(self):
         if self.current_path:
             self.load_log(self.current_path)
@@ -498,30 +1207,31 @@ class LogReaderGUI(TkinterDnD.Tk):
         path = e.data.strip('{}')
         self.load_log(path)
 
+    def open_archive(self):
+        if self.archive_window and self.archive_window.winfo_exists():
+            self.archive_window.lift()
+            return
+        try:
+            archive = SessionArchive()
+        except (OSError, ValueError, sqlite3.Error) as e:
+            messagebox.showerror('Archive', f'Could not open the session archive:\n{e}')
+            return
+        self.archive_window = ArchiveWindow(self, archive)
+
     def load_log(self, path):
         try:
-            self.cancel_auto_refresh()
+            self.stop_watching()
             if not os.access(path, os.R_OK):
                 raise PermissionError("File is locked or inaccessible")
             
             use_utc = self.utc_var.get()
-            parsed_data = parse_log(path, use_utc=use_utc)
-            
-            self.current_path = path
-            self.log_data = parsed_data
-            self.original_rows['combat'] = parsed_data['CombatEvents']
-            self.original_rows['warnings'] = parsed_data['WarningGroups']
-            self.current_rows['combat'] = parsed_data['CombatEvents'].copy()
-            self.current_rows['warnings'] = parsed_data['WarningGroups'].copy()
-            self.last_mtime = os.path.getmtime(path)
-            
-            if self.auto_refresh_var.get():
-                self.schedule_auto_refresh()
-                
-            self.filter_var.set('')
-            self.sort_info = {'combat': None, 'warnings': None}
-            self.expanded_groups.clear()
-            self.update_display()
+            # Timings describe the latest load; a profiled load skips the cache
+            self.timer.reset()
+            cache = None if self.timer.capture else self.cache
+            # A log that isn't watched won't get the rest of its last line
+            final = not self.auto_refresh_var.get()
+            self.start_worker(ParseWorker(LogParser(path, use_utc=use_utc, rules=self.rules),
+                                          path, cache, self.timer, final, None if final else self.retention))
         except PermissionError as e:
             messagebox.showerror('Error', 
                 f"Could not read {Path(path).name}:\n"
@@ -530,6 +1240,210 @@ class LogReaderGUI(TkinterDnD.Tk):
         except Exception as e:
             messagebox.showerror('Error', f'Failed to parse log:\n{e}')
 
+    def tail_log(self):
+        # Parse only what was appended since the last update and merge it in
+        self.start_worker(ParseWorker(self.parser, timer=self.timer, retention=self.retention))
+
+    def start_worker(self, worker):
+        # A new load supersedes whatever is being parsed
+        if self.worker:
+            self.worker.cancel()
+        self.worker = worker
+        worker.start()
+        self.poll_worker(worker)
+
+    def poll_worker(self, worker):
+        if worker is not self.worker:
+            return
+        try:
+            while True:
+                kind, *payload = worker.queue.get_nowait()
+                if kind == 'progress':
+                    self.show_progress(*payload)
+                    continue
+                self.worker = None
+                self.hide_progress()
+                if kind == 'done':
+                    self.finish_parse(worker, *payload)
+                elif worker.path is None:
+                    self.tail_failed(payload[0])
+                else:
+                    messagebox.showerror('Error', f'Failed to parse log:\n{payload[0]}')
+                return
+        except queue.Empty:
+            pass
+        self.after(50, self.poll_worker, worker)
+
+    def tail_failed(self, error):
+        # The parser may hold part of the failed update's rows without having
+        # moved past them, so it can't simply go on: stop auto-refresh rather
+        # than failing on every change, and read the log again from the start
+        self.parser.reset()
+        self.auto_refresh_var.set(False)
+        messagebox.showerror('Refresh Error', f'Auto-refresh failed and was turned off:\n{error}')
+        self.load_log(self.current_path)
+
+    def show_progress(self, done, total):
+        if not self.progress_bar.winfo_ismapped():
+            self.progress_label.pack(side='right', padx=5)
+            self.progress_bar.pack(side='right', padx=5)
+        self.progress_bar.configure(maximum=max(total, 1), value=done)
+        self.progress_var.set(f"{done / 2**20:.1f} / {total / 2**20:.1f} MB")
+
+    def hide_progress(self):
+        self.progress_bar.pack_forget()
+        self.progress_label.pack_forget()
+
+    def finish_parse(self, worker, delta):
+        if worker.path is None and not delta['Reset']:
+            self.log_data.update(self.parser.header())
+            self.update_summary()
+            self.apply_delta(delta)
+            return
+
+        path = worker.path or self.current_path
+        self.parser = worker.parser
+        self.close_spill()
+        self.spill = worker.spill
+
+        self.current_path = path
+        # Only the header: the rows live in original_rows, where live mode
+        # can retire them
+        self.log_data = self.parser.header()
+        for tab, rows in worker.rows.items():
+            self.original_rows[tab] = rows
+            self.current_rows[tab] = rows.copy()
+        self.indexes = worker.indexes
+        self.stats = worker.stats
+        if worker.path and self.auto_refresh_var.get():
+            self.start_watching()
+
+        self.filter_var.set('')
+        self.filter_info = {'combat': '', 'warnings': ''}
+        self.sort_info = {'combat': None, 'warnings': None}
+        self.update_headings('combat')
+        self.update_headings('warnings')
+        self.analysis_view.expanded.clear()
+        self.update_display(top=0)
+        self.update_stats()
+        self.auto_resize_columns()
+        self.retire_rows()
+        if self.timer.enabled:
+            self.timer.add('load', time.perf_counter() - worker.started)
+            self.update_summary()
+
+    def apply_delta(self, delta):
+        with self.timer.phase('stats'):
+            self.stats.apply(delta)
+        self.update_stats()
+
+        for group in delta['RemovedGroups']:
+            remove_latest(self.original_rows['warnings'], group)
+            if self.row_matches('warnings', group):
+                self.hide_row('warnings', group)
+            self.indexes['warnings'].remove(group)
+
+        shown_groups, hidden_groups = [], []
+        sorted_groups = bool(self.sort_info['warnings'])
+        for group in delta['UpdatedGroups']:
+            # New messages can move a group in a sorted view, and make it
+            # start or stop matching the filter
+            shown = self.row_matches('warnings', group)
+            if shown and sorted_groups:
+                self.hide_row('warnings', group)
+            self.indexes['warnings'].refresh(group)
+            if self.row_matches('warnings', group):
+                shown_groups.append(group)
+                if sorted_groups or not shown:
+                    self.show_rows('warnings', [group])
+            elif shown:
+                hidden_groups.append(group)
+                if not sorted_groups:
+                    self.hide_row('warnings', group)
+
+        self.indexes['combat'].add(delta['CombatEvents'])
+        self.indexes['warnings'].add(delta['WarningGroups'])
+        self.original_rows['combat'].extend(delta['CombatEvents'])
+        self.original_rows['warnings'].extend(delta['WarningGroups'])
+        new_combat = [e for e in delta['CombatEvents'] if self.row_matches('combat', e)]
+        new_groups = [g for g in delta['WarningGroups'] if self.row_matches('warnings', g)]
+        self.show_rows('combat', new_combat)
+        self.show_rows('warnings', new_groups)
+        # Only the rows in view are rendered, so this stays cheap
+        self.update_display()
+
+        # Only the new cells are measured
+        self.resize_for_rows('combat', new_combat)
+        self.resize_for_rows('warnings', shown_groups + new_groups)
+        if delta['RemovedGroups'] or hidden_groups:
+            removed = set(delta['RemovedGroups']).union(hidden_groups)
+            self.resize_without('warnings', lambda row: row not in removed)
+        self.retire_rows()
+
+    SORTED_INSERT_LIMIT = 500  # rows placed one by one in a sorted view before it is rebuilt
+
+    def show_rows(self, tab, rows):
+        # Add newly matching rows to the displayed ones: at the end, or each
+        # at its place in a sorted view, which is only rebuilt for big updates
+        sort = self.sort_info[tab]
+        if not sort:
+            self.current_rows[tab].extend(rows)
+        elif len(rows) > self.SORTED_INSERT_LIMIT:
+            self.sort_rows(tab)
+        else:
+            for row in rows:
+                self.indexes[tab].insert_sorted(self.current_rows[tab], row, sort)
+
+    def hide_row(self, tab, row):
+        # Before the index drops or re-keys row
+        if self.sort_info[tab]:
+            self.indexes[tab].remove_sorted(self.current_rows[tab], row, self.sort_info[tab])
+        else:
+            remove_latest(self.current_rows[tab], row)
+
+    SPILL_KINDS = {'combat': 'CombatEvents', 'warnings': 'WarningGroups', 'stats': None}
+
+    def retire_rows(self):
+        # Live mode: while auto-refreshing, rows outside the retention policy
+        # move from memory to the spill file. Statistics and the header come
+        # from running totals and the parser, so they are unaffected
+        if not self.parser or self.worker or not self.auto_refresh_var.get() or self.retention == (None, None):
+            return
+        with self.timer.phase('retire'):
+            retired = self.parser.retire(*retire_args(self.parser, self.retention, RETIRE_BATCH))
+            if not retired:
+                return
+            if self.spill is None:
+                self.spill = SpillFile()
+            self.spill.add(retired)
+            self.stats.forget_groups(retired.get('WarningGroups', ()))
+            for tab in ('combat', 'warnings'):
+                rows = retired.get(self.SPILL_KINDS[tab])
+                if not rows:
+                    continue
+                gone = set(rows)
+                for row in rows:
+                    self.indexes[tab].remove(row)
+                self.indexes[tab].compact()
+                # In place: the views hold these lists
+                self.original_rows[tab][:] = [row for row in self.original_rows[tab] if row not in gone]
+                shown = len(self.current_rows[tab])
+                self.current_rows[tab][:] = [row for row in self.current_rows[tab] if row not in gone]
+                view = self.views[tab]
+                if not self.sort_info[tab]:
+                    # The rows went from the top, keep the same ones in view
+                    view.top = max(0, view.top - (shown - len(self.current_rows[tab])))
+                if tab == 'warnings':
+                    view.expanded.difference_update(row['Offset'] for row in rows)
+                view.set_rows(self.current_rows[tab])
+                self.resize_without(tab, lambda row: row not in gone)
+        self.update_summary()
+
+    def close_spill(self):
+        if self.spill:
+            self.spill.close()
+            self.spill = None
+
 if __name__ == '__main__':
     try:
         LogReaderGUI().mainloop()
@@ -0,0 +1,294 @@
+"""Benchmarks for the parser and the GUI model hot paths.
+
+Logs come from synth_log.py and are kept in --workdir between runs. Each
+parse case runs in a fresh process so its peak RSS is its own. Results are
+written as JSON; --compare prints the ratios against an earlier run.
+--verify checks that the parallel parse gives the same results as the
+serial one before timing anything.
+"""
+import argparse
+import gc
+import importlib.util
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import get_context
+from pathlib import Path
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+from synth_log import generate, parse_size
+import ee_parser
+from ee_parser import LogParser, as_dicts
+from ee_search import COMBAT_SEARCH, WARNING_SEARCH, SearchIndex, SortOrders
+
+# Typing sequences for the filter benchmark; each prefix is searched in
+# turn, the way apply_filter sees them while the user types
+FILTER_QUERIES = {
+    'combat': ['k', 'ku', 'kuv', 'kuva', 'kuva lich', 'damage>1000', 'damage>1000 source:lancer'],
+    'warnings': ['h', 'hi', 'high', 'high dmg', 'damage>1e9', 'count>2'],
+}
+
+def peak_rss_mb():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports KiB, macOS bytes
+    return peak / 2**20 if sys.platform == 'darwin' else peak / 2**10
+
+def count_lines(path):
+    lines = 0
+    with open(path, 'rb') as f:
+        while chunk := f.read(2**24):
+            lines += chunk.count(b'\n')
+    return lines
+
+def best_of(repeat, func):
+    times = []
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        result = func()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+def parse_once(path, mode):
+    parser = LogParser(path)
+    parser.update(final=True, mode=mode)
+    return parser
+
+def parse_case(path, mode, repeat):
+    """Run in a fresh process: time the parse, then measure its allocations."""
+    seconds, parser = best_of(repeat, lambda: parse_once(path, mode))
+    counts = len(parser.combat_events), len(parser.warning_groups)
+    del parser
+    rss = peak_rss_mb()
+    tracemalloc.start()
+    parse_once(path, mode)
+    traced_peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'seconds': seconds, 'peak_rss_mb': rss, 'tracemalloc_peak_mb': traced_peak / 2**20,
+            'combat_events': counts[0], 'warning_groups': counts[1]}
+
+def bench_parse(logs, modes, repeat):
+    results = []
+    for size_text, path in logs:
+        size = os.path.getsize(path)
+        lines = count_lines(path)
+        for mode in modes:
+            with ProcessPoolExecutor(1, mp_context=get_context('spawn')) as pool:
+                case = pool.submit(parse_case, str(path), mode, repeat).result()
+            case.update({
+                'size': size_text, 'mode': mode, 'bytes': size, 'lines': lines,
+                'lines_per_s': lines / case['seconds'],
+                'mb_per_s': size / 2**20 / case['seconds'],
+            })
+            results.append(case)
+            print(f"parse {size_text:>6} {mode:<8} {case['seconds']:8.3f}s {case['mb_per_s']:7.1f} MB/s "
+                  f"{case['lines_per_s']:10.0f} lines/s  rss {case['peak_rss_mb'] or 0:7.1f} MB  "
+                  f"traced {case['tracemalloc_peak_mb']:7.1f} MB", file=sys.stderr)
+    return results
+
+def same_results(a, b):
+    return all((as_dicts(a[key]) == as_dicts(b[key])) if isinstance(a[key], list) else a[key] == b[key]
+               for key in a)
+
+def verify_parallel(logs, chunk=64 * 1024):
+    """Compare parallel and serial parses of each log, with ranges of chunk
+    bytes so that plenty of warning groups are cut at range boundaries."""
+    saved, ee_parser.PARALLEL_CHUNK = ee_parser.PARALLEL_CHUNK, chunk
+    try:
+        results = {}
+        for size_text, path in logs:
+            for keyword_filter in (True, False):
+                serial = LogParser(path, keyword_filter)
+                serial.update(final=True, mode='stream')
+                parallel = LogParser(path, keyword_filter)
+                parallel.update(final=True, mode='parallel')
+                ok = same_results(serial.result(), parallel.result())
+                results[f'{size_text} keyword_filter={keyword_filter}'] = ok
+                print(f"verify {size_text:>6} keyword_filter={keyword_filter!s:<5} "
+                      f"{'ok' if ok else 'MISMATCH'}", file=sys.stderr)
+        return results
+    finally:
+        ee_parser.PARALLEL_CHUNK = saved
+
+def load_gui():
+    spec = importlib.util.spec_from_file_location('ee_log_reader', ROOT / 'EE.log_reader.py')
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+def bench_model(tab, spec, rows, repeat):
+    """Time SearchIndex building, filtering and sorting; needs no display."""
+    case = {'rows': len(rows)}
+    case['index_s'], index = best_of(repeat, lambda: SearchIndex(spec).add(rows))
+
+    def run_filters():
+        for query in FILTER_QUERIES[tab]:
+            index.search(query)
+            index.ordered()
+        index.search('')
+    case['filter_s'], _ = best_of(repeat, run_filters)
+
+    for col in spec['sort']:
+        # The first sort builds the order, later ones reuse it
+        index.sort_orders = SortOrders(spec['sort'])
+        case[f'sort_{col}_cold_s'], _ = best_of(1, lambda: index.ordered((col, False)))
+        case[f'sort_{col}_cached_s'], _ = best_of(repeat, lambda: index.ordered((col, True)))
+    return case
+
+def bench_gui(path, repeat):
+    """Time the pieces behind apply_filter, sort_rows, update_display and
+    auto_resize_columns on the rows of one parsed log. Rendering and column
+    sizing need Tk and a display and are skipped without them; the search
+    model is timed either way."""
+    parser = parse_once(path, 'stream')
+    parsed = parser.result()
+    tabs = {'combat': (COMBAT_SEARCH, parsed['CombatEvents']),
+            'warnings': (WARNING_SEARCH, parsed['WarningGroups'])}
+    results = {tab: bench_model(tab, spec, rows, repeat) for tab, (spec, rows) in tabs.items()}
+
+    try:
+        gui = load_gui()
+        root = gui.tk.Tk()
+    except Exception as e:
+        results['skipped'] = f'render and resize: {type(e).__name__}: {e}'
+        root = None
+    try:
+        if root is not None:
+            root.geometry('1400x800')
+        for tab, values in (('combat', 'combat_values'), ('warnings', 'group_values')):
+            spec, rows = tabs[tab]
+            case = results[tab]
+            if root is not None:
+                case.update(bench_render(gui, root, list(spec['sort']), rows,
+                                         getattr(gui.LogReaderGUI, values), repeat))
+            print(f"gui {tab}: " + ', '.join(f'{k} {v:.4f}' for k, v in case.items() if k.endswith('_s')),
+                  file=sys.stderr)
+    finally:
+        if root is not None:
+            root.destroy()
+    return results
+
+def bench_render(gui, root, columns, rows, values, repeat):
+    case = {}
+    tree = gui.ttk.Treeview(root, columns=columns, show='headings')
+    scroll = gui.ttk.Scrollbar(root, orient='vertical')
+    tree.pack(fill='both', expand=True)
+    root.update()
+    view = gui.VirtualTree(tree, scroll, values)
+
+    def render():
+        view.set_rows(rows, top=0)
+        for _ in range(100):
+            view.scroll(30)
+        root.update_idletasks()
+    case['render_100_scrolls_s'], _ = best_of(repeat, render)
+
+    def resize():
+        sizer = gui.ColumnSizer(tree, {})
+        sizer.reset(view.sample_rows(gui.ColumnSizer.SAMPLE_LIMIT))
+        sizer.apply()
+    case['resize_s'], _ = best_of(repeat, resize)
+    tree.destroy()
+    scroll.destroy()
+    return case
+
+def synth_path(workdir, size_text, seed):
+    # Generated once and reused by later runs with the same size and seed
+    path = workdir / f'synth-{size_text}-{seed}.log'
+    if not path.exists() or os.path.getsize(path) < parse_size(size_text):
+        print(f'generating {path}', file=sys.stderr)
+        generate(path, parse_size(size_text), seed)
+    return path
+
+def git_revision():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def compare(results, baseline):
+    old = {(c['size'], c['mode']): c for c in baseline.get('parse', [])}
+    for case in results['parse']:
+        if prev := old.get((case['size'], case['mode'])):
+            print(f"parse {case['size']:>6} {case['mode']:<8} {case['mb_per_s'] / prev['mb_per_s']:6.2f}x "
+                  f"speed, {(case['peak_rss_mb'] or 0) - (prev['peak_rss_mb'] or 0):+7.1f} MB rss",
+                  file=sys.stderr)
+    for tab, case in results.get('gui', {}).items():
+        prev = baseline.get('gui', {}).get(tab)
+        if isinstance(case, dict) and isinstance(prev, dict):
+            for key, value in case.items():
+                if key.endswith('_s') and prev.get(key):
+                    print(f"gui {tab} {key}: {prev[key] / max(value, 1e-9):6.2f}x speed", file=sys.stderr)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark parse_log and the GUI model on synthetic logs.')
+    parser.add_argument('--sizes', default='1MB,10MB,100MB',
+                        help='comma separated log sizes, 1MB up to 2GB (default: 1MB,10MB,100MB)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--modes', default='stream,mmap',
+                        help='parse modes to time: stream, mmap, parallel (default: stream,mmap)')
+    parser.add_argument('--repeat', type=int, default=3, help='runs per case, best is kept (default: 3)')
+    parser.add_argument('--workdir', default=Path(__file__).resolve().parent / 'logs',
+                        help='where generated logs are kept (default: bench/logs)')
+    parser.add_argument('--no-gui', action='store_true', help='skip the GUI model benchmarks')
+    parser.add_argument('--gui-size', help='log size for the GUI benchmarks (default: the smallest)')
+    parser.add_argument('-o', '--output', help='write the results as JSON to this file')
+    parser.add_argument('--compare', help='earlier JSON results to compare against')
+    parser.add_argument('--verify', action='store_true',
+                        help='check that parallel parsing matches the serial parse first')
+    args = parser.parse_args(argv)
+
+    workdir = Path(args.workdir)
+    workdir.mkdir(parents=True, exist_ok=True)
+    sizes = [size.strip() for size in args.sizes.split(',')]
+    logs = [(size, synth_path(workdir, size, args.seed)) for size in sizes]
+
+    verified = verify_parallel(logs) if args.verify else None
+    if verified and not all(verified.values()):
+        return 1
+
+    results = {
+        'meta': {
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'cpus': os.cpu_count(),
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'seed': args.seed,
+            'repeat': args.repeat,
+        },
+        'parse': bench_parse(logs, args.modes.split(','), args.repeat),
+    }
+    if verified:
+        results['verify'] = verified
+    if not args.no_gui:
+        gui_log = synth_path(workdir, args.gui_size or sizes[0], args.seed)
+        results['gui'] = bench_gui(str(gui_log), args.repeat)
+        if 'skipped' in results['gui']:
+            print(f"gui skipped {results['gui']['skipped']}", file=sys.stderr)
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+    if args.compare:
+        with open(args.compare, encoding='utf-8') as f:
+            compare(results, json.load(f))
+
+if __name__ == '__main__':
+    sys.exit(main())
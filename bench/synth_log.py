@@ -0,0 +1,104 @@
+"""Deterministic synthetic EE.log generator for benchmarks.
+
+The same seed and size always produce the same bytes. The mix follows real
+logs: mostly Sys/Net/Script chatter, bursts of Game [Warning] spam sharing
+one offset (with and without 'high dmg:'), 'Cannot create' noise, untimed
+continuation lines and a few percent of combat lines, RAZORFLIES included.
+"""
+import argparse
+import random
+import re
+import sys
+
+SIZE_UNITS = {'': 1, 'B': 1, 'KB': 2**10, 'MB': 2**20, 'GB': 2**30}
+
+VICTIMS = ['Corrupted Heavy Gunner', 'Kuva Lich', 'Eximus, Arson', 'Infested Charger',
+           'Grineer Lancer', 'Corpus Tech', 'RAZORFLIES', 'Sister of Parvos']
+SOURCES = ['from a Grineer Lancer using a Grakata', 'from a Eximus, Arson using a Napalm',
+           'from an Infested Charger', 'from a Corpus Tech using a Supra', 'from a Kuva Lich using a Kuva Ogris']
+WEAPONS = ['Lancer', 'Grakata', 'Napalm', 'Ogris', 'Supra', 'Acceltra', 'Torid']
+CHATTER = [
+    'Net [Info]: Replication: {n} objects in {k} packets',
+    'Sys [Info]: Streaming: loaded /Lotus/Levels/Tile{n}.lvl',
+    'Script [Info]: ThemedSquadOverlay.lua: Mission vote {k} of 4',
+    'Game [Info]: AI: spawning /Lotus/Types/Enemies/Grineer/Lancer{k} at wave {n}',
+    'Sys [Info]: Resource load completed in {k}.{n}ms',
+    'Net [Info]: Ping to host: {k}ms',
+]
+
+def parse_size(text):
+    m = re.fullmatch(r'\s*([0-9.]+)\s*([KMG]?B?)\s*', text.upper())
+    if not m:
+        raise argparse.ArgumentTypeError(f'bad size: {text}')
+    return int(float(m.group(1)) * SIZE_UNITS[m.group(2)])
+
+def iter_lines(seed=0, player='Tenno_Player'):
+    """Yield log lines (without line endings) forever."""
+    r = random.Random(seed)
+    t = 0.6
+    yield f"{t:.3f} Sys [Info]: Logged in {player} (5f0c{seed:020d})"
+    t += 0.1
+    yield (f"{t:.3f} Sys [Diag]: Current time: Sat Oct 17 20:01:02 2026 "
+           f"[UTC: Sat Oct 17 18:01:02 2026]")
+    victims = VICTIMS + [player] * 2
+    while True:
+        t += r.expovariate(20)
+        ts = f"{t:.3f}"
+        k = r.random()
+        if k < 0.04:
+            victim, state = r.choice(victims), r.choice(('killed', 'killed', 'downed'))
+            damage = f"{r.uniform(1, 2e6):.3f}"
+            info = f"{r.uniform(-100, 100):.2f} / {damage}" if r.random() < 0.7 else damage
+            source = r.choice(SOURCES) if r.random() < 0.9 else ''
+            yield f"{ts} Game [Info]: {victim} was {state} by {info} damage {source}".rstrip()
+            if r.random() < 0.3:
+                yield f"{ts} Game [Warning]: high dmg: {r.uniform(1e5, 1e12):.4e} ({r.choice(WEAPONS)})"
+        elif k < 0.22:
+            # Warnings come in bursts logged at the same offset
+            for _ in range(r.choice((1, 1, 1, 2, 3, 6))):
+                kind = r.random()
+                if kind < 0.45:
+                    text = f"high dmg: {r.uniform(1e3, 1e12):.4e} from {r.choice(WEAPONS)}"
+                elif kind < 0.6:
+                    text = f"Damage {r.uniform(1e3, 1e9):.0f} clamped on {r.choice(VICTIMS)}"
+                elif kind < 0.8:
+                    text = f"Cannot create damage effect /Lotus/Fx/Hit{r.randrange(999)}"
+                else:
+                    text = f"Missing animation {r.randrange(9999)} on {r.choice(VICTIMS)}"
+                yield f"{ts} Game [Warning]: {text}"
+        elif k < 0.28:
+            yield f"    continuation of the previous entry {r.randrange(10**6)}"
+        else:
+            yield f"{ts} " + r.choice(CHATTER).format(n=r.randrange(10000), k=r.randrange(100))
+
+def generate(path, size, seed=0, player='Tenno_Player', newline='\r\n'):
+    """Write at least size bytes of synthetic log to path; returns (bytes, lines)."""
+    written = lines = 0
+    chunk = []
+    with open(path, 'w', encoding='utf-8', newline='') as f:
+        for line in iter_lines(seed, player):
+            line += newline
+            chunk.append(line)
+            written += len(line)
+            lines += 1
+            if len(chunk) >= 10000 or written >= size:
+                f.write(''.join(chunk))
+                chunk.clear()
+                if written >= size:
+                    break
+    return written, lines
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Write a deterministic synthetic EE.log.')
+    parser.add_argument('path')
+    parser.add_argument('--size', type=parse_size, default=parse_size('10MB'),
+                        help='target size, e.g. 512KB, 100MB, 2GB (default: 10MB)')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--player', default='Tenno_Player')
+    parser.add_argument('--lf', action='store_true', help='use \\n line endings instead of \\r\\n')
+    args = parser.parse_args(argv)
+    written, lines = generate(args.path, args.size, args.seed, args.player, '\n' if args.lf else '\r\n')
+    print(f'{args.path}: {lines} lines, {written / 2**20:.1f} MB', file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
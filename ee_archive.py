@@ -0,0 +1,213 @@
+import os
+import sys
+import time
+import sqlite3
+from itertools import repeat
+from pathlib import Path
+
+from ee_cache import block_hash
+from ee_parser import LogParser
+
+SCHEMA_VERSION = 1
+KEY_BLOCK = 4096    # bytes at the start of a log hashed into its session key
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS sessions (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    player TEXT,
+    start_time REAL NOT NULL,
+    end_time REAL NOT NULL,
+    combat_count INTEGER NOT NULL,
+    warning_count INTEGER NOT NULL,
+    ingested REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    size INTEGER NOT NULL,
+    mtime INTEGER NOT NULL,
+    key TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS combat (
+    session_id INTEGER NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+    offset REAL NOT NULL,
+    time REAL NOT NULL,
+    victim TEXT NOT NULL,
+    state TEXT NOT NULL,
+    health TEXT NOT NULL,
+    damage TEXT NOT NULL,
+    value REAL NOT NULL,
+    source TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS warnings (
+    session_id INTEGER NOT NULL REFERENCES sessions(id) ON DELETE CASCADE,
+    offset REAL NOT NULL,
+    time REAL NOT NULL,
+    count INTEGER NOT NULL,
+    max_damage REAL NOT NULL,
+    messages TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_start ON sessions(start_time);
+CREATE INDEX IF NOT EXISTS combat_session ON combat(session_id);
+CREATE INDEX IF NOT EXISTS combat_victim ON combat(victim);
+CREATE INDEX IF NOT EXISTS combat_source ON combat(source);
+CREATE INDEX IF NOT EXISTS combat_value ON combat(value);
+CREATE INDEX IF NOT EXISTS combat_time ON combat(time);
+CREATE INDEX IF NOT EXISTS warnings_session ON warnings(session_id);
+CREATE INDEX IF NOT EXISTS warnings_damage ON warnings(max_damage);
+CREATE INDEX IF NOT EXISTS warnings_time ON warnings(time);
+"""
+
+# Canned queries for the CLI and the GUI archive window. Parameters are
+# :since (epoch seconds), :limit and :min_damage; see query_params()
+QUERIES = {
+    'sessions': """
+        SELECT datetime(start_time, 'unixepoch', 'localtime') AS Start,
+               datetime(end_time, 'unixepoch', 'localtime') AS End,
+               player AS Player, combat_count AS CombatEvents,
+               warning_count AS WarningGroups, path AS File
+        FROM sessions WHERE start_time >= :since
+        ORDER BY start_time DESC LIMIT :limit""",
+    'downed-by': """
+        SELECT c.source AS Source, count(*) AS Downs, max(c.value) AS MaxDamage,
+               count(DISTINCT c.session_id) AS Sessions
+        FROM combat c JOIN sessions s ON s.id = c.session_id
+        WHERE c.state = 'downed' AND c.victim = s.player AND c.time >= :since
+        GROUP BY c.source ORDER BY Downs DESC LIMIT :limit""",
+    'top-damage': """
+        SELECT datetime(c.time, 'unixepoch', 'localtime') AS Time, c.victim AS Victim,
+               c.state AS State, c.value AS Damage, c.source AS Source, s.path AS File
+        FROM combat c JOIN sessions s ON s.id = c.session_id
+        WHERE c.time >= :since ORDER BY c.value DESC LIMIT :limit""",
+    'big-warnings': """
+        SELECT datetime(s.start_time, 'unixepoch', 'localtime') AS Start, s.player AS Player,
+               count(*) AS Warnings, max(w.max_damage) AS MaxDamage, s.path AS File
+        FROM warnings w JOIN sessions s ON s.id = w.session_id
+        WHERE w.max_damage >= :min_damage AND w.time >= :since
+        GROUP BY s.id ORDER BY MaxDamage DESC LIMIT :limit""",
+}
+
+def default_archive_path():
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or Path.home() / 'AppData' / 'Local'
+    else:
+        base = os.environ.get('XDG_DATA_HOME') or Path.home() / '.local' / 'share'
+    return Path(base) / 'ee-log-reader' / 'archive.sqlite3'
+
+def query_params(days=None, limit=20, min_damage=1e9):
+    """Bind values for QUERIES; days=None means no time limit."""
+    return {
+        'since': time.time() - days * 86400 if days else 0,
+        'limit': limit if limit else -1,
+        'min_damage': min_damage
+    }
+
+class SessionArchive:
+    """Parsed sessions stored in SQLite for queries across many logs.
+
+    A session is identified by its start time (from the diag line), if
+    any, and a hash of the first KEY_BLOCK bytes, so ingesting the same log
+    again, a copy of it or a longer version of it never duplicates the
+    session: the longest version seen is kept. Different logs that happen
+    to share a start time keep sessions of their own. Logs shorter than
+    KEY_BLOCK aren't stored until they have grown past it. The files table
+    remembers the size and mtime of every ingested file so unchanged files
+    are skipped without parsing. Each ingest runs in one transaction with bulk
+    inserts straight from the parser's stores.
+    """
+
+    def __init__(self, path=None):
+        self.path = Path(path) if path else default_archive_path()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.db = sqlite3.connect(self.path)
+        self.db.execute('PRAGMA foreign_keys = ON')
+        self.db.execute('PRAGMA journal_mode = WAL')
+        self.db.execute('PRAGMA synchronous = NORMAL')
+        version = self.db.execute('PRAGMA user_version').fetchone()[0]
+        if version not in (0, SCHEMA_VERSION):
+            raise ValueError(f'{self.path} uses archive schema {version}, expected {SCHEMA_VERSION}')
+        with self.db:
+            self.db.executescript(SCHEMA)
+            self.db.execute(f'PRAGMA user_version = {SCHEMA_VERSION}')
+
+    def close(self):
+        self.db.close()
+
+    @staticmethod
+    def session_key(parser):
+        # Only bytes that never change as the log grows; not the player,
+        # who logs in after the diag line
+        with open(parser.file_path, 'rb') as f:
+            head = block_hash(f, 0, KEY_BLOCK).hex()
+        if parser.start_time is not None:
+            return f'log:{parser.start_time!r}:{head}'
+        return 'head:' + head
+
+    def is_current(self, path):
+        """True if path, at its current size and mtime, is already stored."""
+        stat = os.stat(path)
+        return self.db.execute(
+            'SELECT 1 FROM files WHERE path = ? AND size = ? AND mtime = ?',
+            (os.path.abspath(path), stat.st_size, stat.st_mtime_ns)
+        ).fetchone() is not None
+
+    def ingest(self, path, min_keyword_filter=True, force=False):
+        """Parse path and store it; returns False if it was already current
+        or a version of its session at least as long is stored."""
+        if not force and self.is_current(path):
+            return False
+        parser = LogParser(path, min_keyword_filter)
+        parser.update(final=True)
+        return self.ingest_parser(parser)
+
+    def ingest_parser(self, parser):
+        """Store an already parsed LogParser unless a version of the session
+        at least as long is stored; returns whether it was stored. Raises
+        ValueError for a log still shorter than KEY_BLOCK."""
+        if any(parser.retired.values()):
+            raise ValueError('the parser retired rows of the log, ingest the file instead')
+        if parser.position < KEY_BLOCK:
+            raise ValueError(f'only {parser.position} bytes long, it can be archived '
+                             f'once it has grown past {KEY_BLOCK}')
+        stat = os.stat(parser.file_path)
+        path = os.path.abspath(parser.file_path)
+        mtime = stat.st_mtime_ns if stat.st_size == parser.position else 0
+        base = parser.base_time
+        last = parser.last_offset
+        combat, warnings = parser.combat, parser.warnings
+        with self.db:
+            key = self.session_key(parser)
+            self.db.execute('INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?)',
+                            (path, parser.position, mtime, key))
+            stored = self.db.execute('SELECT id, size, path FROM sessions WHERE key = ?', (key,)).fetchone()
+            # A shorter copy, or a same-size copy elsewhere, adds nothing
+            if stored and (stored[1] > parser.position or stored[1] == parser.position and stored[2] != path):
+                return False
+            self.db.execute('DELETE FROM sessions WHERE key = ?', (key,))
+            session_id = self.db.execute(
+                'INSERT INTO sessions (key, path, size, mtime, player, start_time, end_time,'
+                ' combat_count, warning_count, ingested) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, path, parser.position, mtime, parser.player_name, base, base + last if last is not None else base,
+                 len(parser.combat_events), len(parser.warning_groups), time.time())
+            ).lastrowid
+            self.db.executemany(
+                'INSERT INTO combat VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                zip(repeat(session_id), combat.offsets, (base + off for off in combat.offsets),
+                    combat.victims, combat.states, combat.healths, combat.damages,
+                    combat.values, combat.sources)
+            )
+            self.db.executemany(
+                'INSERT INTO warnings VALUES (?, ?, ?, ?, ?, ?)',
+                ((session_id, warnings.offsets[g.index], base + warnings.offsets[g.index],
+                  warnings.counts[g.index], warnings.max_damage[g.index],
+                  '\n'.join(warnings.texts[m] for m in warnings.messages(g.index)))
+                 for g in parser.warning_groups.values())
+            )
+        return True
+
+    def query(self, sql, params=None):
+        """Run a named query from QUERIES or raw SQL; returns (columns, rows)."""
+        cursor = self.db.execute(QUERIES.get(sql, sql), params or {})
+        return [d[0] for d in cursor.description or ()], cursor.fetchall()
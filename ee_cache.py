@@ -0,0 +1,146 @@
+import os
+import sys
+import pickle
+import hashlib
+import tempfile
+from pathlib import Path
+
+from ee_parser import PARSER_VERSION
+from ee_rules import rules_digest
+
+# Bump when the entry layout below changes; PARSER_VERSION covers the parser
+CACHE_VERSION = 1
+HEAD_BLOCK = 64 * 1024  # bytes hashed at the start of the file
+TAIL_BLOCK = 4 * 1024   # bytes hashed just before the cached position
+DEFAULT_LIMIT = 512 * 1024 * 1024
+
+def default_cache_dir():
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA') or Path.home() / 'AppData' / 'Local'
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or Path.home() / '.cache'
+    return Path(base) / 'ee-log-reader'
+
+def block_hash(f, start, end):
+    f.seek(start)
+    return hashlib.blake2b(f.read(max(end - start, 0)), digest_size=16).digest()
+
+class ParseCache:
+    """Pickled LogParser state on disk, one entry per log file.
+
+    An entry records the path, the file size and mtime the parser had seen,
+    and hashes of the first block and of the block just before the parsed
+    position. When the file still starts with the same bytes and has only
+    grown, the cached parser is returned and its next update() parses just
+    the appended bytes. Anything else (truncation, a different file at the
+    same path, an entry from another parser version or rule config) is a
+    miss.
+
+    Each entry file holds a small header pickle followed by the parser
+    pickle, so an entry is validated without loading the results. Entries
+    are evicted least recently used first once the directory grows past
+    limit bytes; a hit bumps the entry's mtime.
+    """
+
+    def __init__(self, directory=None, limit=DEFAULT_LIMIT):
+        self.directory = Path(directory) if directory else default_cache_dir()
+        self.limit = limit
+
+    def entry_path(self, path, min_keyword_filter=True):
+        key = f"{os.path.abspath(path)}\0{int(min_keyword_filter)}"
+        return self.directory / (hashlib.sha1(key.encode('utf-8')).hexdigest() + '.pickle')
+
+    @staticmethod
+    def fingerprint(path, position):
+        with open(path, 'rb') as f:
+            return (block_hash(f, 0, min(HEAD_BLOCK, position)),
+                    block_hash(f, max(position - TAIL_BLOCK, 0), position))
+
+    def load(self, path, min_keyword_filter=True, use_utc=False, rules=None):
+        """Return the cached LogParser for path, or None on a miss."""
+        entry = self.entry_path(path, min_keyword_filter)
+        try:
+            with open(entry, 'rb') as f:
+                header = pickle.load(f)
+                if (header.get('Version') != (CACHE_VERSION, PARSER_VERSION)
+                        or header['Path'] != os.path.abspath(path)
+                        or header.get('Rules') != rules_digest(rules)):
+                    raise ValueError('stale cache entry')
+                stat = os.stat(path)
+                if stat.st_size < header['Position']:
+                    raise ValueError('log was truncated')
+                unchanged = (stat.st_size, stat.st_mtime_ns) == (header['Size'], header['Mtime'])
+                if not unchanged and self.fingerprint(path, header['Position']) != header['Fingerprint']:
+                    raise ValueError('log was replaced')
+                parser = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception:
+            # Stale, foreign or corrupt entries are dropped, never fatal
+            self.discard(path, min_keyword_filter)
+            return None
+        os.utime(entry)
+        parser.file_path = path
+        parser.clock.use_utc = use_utc
+        parser.cache_stamp = header['Size'], header['Mtime']
+        return parser
+
+    def store(self, parser):
+        """Save parser's state, unless the entry is already up to date or
+        the parser retired rows (see LogParser.retire) and lacks some."""
+        if any(parser.retired.values()):
+            return
+        stat = os.stat(parser.file_path)
+        entry = self.entry_path(parser.file_path, parser.min_keyword_filter)
+        if getattr(parser, 'cache_stamp', None) == (stat.st_size, stat.st_mtime_ns) and entry.exists():
+            return
+        header = {
+            'Version': (CACHE_VERSION, PARSER_VERSION),
+            'Path': os.path.abspath(parser.file_path),
+            'Rules': rules_digest(parser.rules),
+            'Position': parser.position,
+            # Size and mtime as of the parse; the file may have grown since
+            'Size': parser.position,
+            'Mtime': stat.st_mtime_ns if stat.st_size == parser.position else None,
+            'Fingerprint': self.fingerprint(parser.file_path, parser.position)
+        }
+        self.directory.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(suffix='.tmp', dir=self.directory)
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                pickle.dump(header, f, pickle.HIGHEST_PROTOCOL)
+                pickle.dump(parser, f, pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, entry)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        parser.cache_stamp = header['Size'], header['Mtime']
+        self.evict(keep=entry)
+
+    def discard(self, path, min_keyword_filter=True):
+        try:
+            os.remove(self.entry_path(path, min_keyword_filter))
+        except OSError:
+            pass
+
+    def evict(self, keep=None):
+        """Remove least recently used entries until the cache fits in limit."""
+        try:
+            entries = [(e.stat(), e) for e in self.directory.glob('*.pickle')]
+        except OSError:
+            return
+        total = sum(st.st_size for st, _ in entries)
+        for st, e in sorted(entries, key=lambda item: item[0].st_mtime):
+            if total <= self.limit:
+                break
+            if e == keep:
+                continue
+            try:
+                e.unlink()
+                total -= st.st_size
+            except OSError:
+                pass
+
+    def clear(self):
+        for e in self.directory.glob('*.pickle'):
+            e.unlink(missing_ok=True)
@@ -0,0 +1,331 @@
+import argparse
+import csv
+import glob
+import json
+import os
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import repeat
+
+from ee_parser import LogParser, parse_log
+from ee_archive import QUERIES, SessionArchive, query_params
+from ee_profile import PhaseTimer
+import ee_export
+from ee_export import combat_record, match_record, warning_record
+from ee_rules import default_rules, load_rules
+
+CSV_COLUMNS = ['File', 'Kind', 'Offset', 'Time', 'Victim', 'State', 'Health', 'Damage',
+               'Value', 'Source', 'Count', 'MaxDamage', 'Message', 'Rule']
+
+def expand_paths(patterns):
+    """Yield the log files named by files, directories (searched for *.log) and globs."""
+    seen = set()
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            matches = sorted(glob.glob(os.path.join(pattern, '**', '*.log'), recursive=True))
+        elif any(c in pattern for c in '*?['):
+            matches = sorted(p for p in glob.glob(pattern, recursive=True) if os.path.isfile(p))
+        else:
+            matches = [pattern]
+        for path in matches:
+            if path not in seen:
+                seen.add(path)
+                yield path
+
+def iter_records(path, parsed):
+    """Yield flat, JSON-ready records for one parsed log: the session first,
+    then its combat events and warning groups."""
+    yield {
+        'File': path,
+        'Kind': 'session',
+        'Player': parsed['Player'],
+        'LogStart': parsed['LogStart'],
+        'LogEnd': parsed['LogEnd'],
+        'CombatEvents': len(parsed['CombatEvents']),
+        'WarningGroups': len(parsed['WarningGroups']),
+        'Matches': len(parsed['Matches'])
+    }
+    for event in parsed['CombatEvents']:
+        yield {'File': path, 'Kind': 'combat', **combat_record(event)}
+    for group in parsed['WarningGroups']:
+        yield {'File': path, 'Kind': 'warning', **warning_record(group)}
+    for event in parsed['Matches']:
+        yield {'File': path, 'Kind': 'match', **match_record(event)}
+
+def write_csv(records, f, header=False):
+    # Sessions have no row of their own; warnings get one row per message
+    ee_export.write_csv((r for r in records if r['Kind'] != 'session'), f, CSV_COLUMNS, header)
+
+WRITERS = {'ndjson': ee_export.write_ndjson, 'csv': write_csv}
+
+def parse_to_file(path, options):
+    """Parse one log in a worker process and write its records to a part file.
+
+    Writing to disk keeps the results out of the pipe back to the main
+    process, which only has to copy the part files to the output in order.
+    """
+    start = time.perf_counter()
+    timer = make_timer(options)
+    try:
+        parsed = parse_log(path, options['keyword_filter'], options['utc'], options['mode'], timer,
+                           options['rules'], options['jobs'])
+        fd, part = tempfile.mkstemp(suffix='.part', dir=options['tmpdir'])
+        with timer.phase('write'), os.fdopen(fd, 'w', encoding='utf-8', newline='') as f:
+            WRITERS[options['format']](iter_records(path, parsed), f)
+    except Exception as e:
+        return {'File': path, 'Error': f'{type(e).__name__}: {e}'}
+    return {
+        'File': path,
+        'Part': part,
+        'Bytes': os.path.getsize(path),
+        'Seconds': time.perf_counter() - start,
+        'CombatEvents': len(parsed['CombatEvents']),
+        'WarningGroups': len(parsed['WarningGroups']),
+        'Timings': timer.snapshot() if timer.enabled else None
+    }
+
+def make_timer(options):
+    timer = PhaseTimer(enabled=options['timings'])
+    timer.capture = options['profile']
+    return timer
+
+def parse_for_archive(path, options):
+    """Parse one log in a worker process; the parser pickles compactly, so
+    it is sent back whole for the main process to insert."""
+    start = time.perf_counter()
+    timer = make_timer(options)
+    try:
+        parser = LogParser(path, options['keyword_filter'], rules=options['rules'])
+        parser.update(final=True, mode=options['mode'], timer=timer, jobs=options['jobs'])
+    except Exception as e:
+        return path, f'{type(e).__name__}: {e}', 0.0, None
+    return path, parser, time.perf_counter() - start, timer.snapshot() if timer.enabled else None
+
+def throughput(size, seconds):
+    return f"{size / 2**20:.1f} MB in {seconds:.2f}s ({size / 2**20 / max(seconds, 1e-9):.1f} MB/s)"
+
+def file_jobs(args, files):
+    # Parallel mode spends the workers inside each file, one file at a time
+    return 1 if args.mode == 'parallel' else max(1, min(args.jobs, files))
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(
+        description='Parse saved EE.log files without the GUI and stream the results.')
+    parser.add_argument('paths', nargs='*', help='log files, directories or glob patterns')
+    parser.add_argument('-o', '--output', help='write to this file instead of stdout')
+    parser.add_argument('-f', '--format', choices=sorted(WRITERS), default='ndjson')
+    parser.add_argument('-j', '--jobs', type=int, default=os.cpu_count() or 1,
+                        help='worker processes (default: one per core)')
+    parser.add_argument('--mode', choices=('stream', 'mmap', 'parallel'), default='stream',
+                        help='parse_log read mode; parallel splits each file across the --jobs workers '
+                             'instead of parsing several files at once')
+    parser.add_argument('--all-warnings', action='store_true',
+                        help="keep warnings that don't mention damage")
+    parser.add_argument('--utc', action='store_true', help='format times in UTC')
+    parser.add_argument('--rules', metavar='FILE',
+                        help='classification rules, TOML or JSON (default: rules.toml in the config directory, if any)')
+    parser.add_argument('-q', '--quiet', action='store_true', help='only print the total summary')
+    parser.add_argument('--timings', metavar='FILE', help='write per-file phase timings as JSON to FILE')
+    parser.add_argument('--profile', choices=('cprofile', 'tracemalloc'),
+                        help='add a profile of each parse to --timings')
+    archive = parser.add_argument_group('session archive')
+    archive.add_argument('--archive', action='store_true',
+                         help='store the parsed logs in the archive database instead of writing them out')
+    archive.add_argument('--query', metavar='NAME|SQL',
+                         help=f"query the archive instead of parsing; names: {', '.join(QUERIES)}")
+    archive.add_argument('--db', help='archive database (default: per-user data directory)')
+    archive.add_argument('--days', type=float, help='only sessions from the last DAYS days')
+    archive.add_argument('--limit', type=int, default=20, help='rows per query, 0 for all (default: 20)')
+    archive.add_argument('--min-damage', type=float, default=1e9,
+                         help='warning damage threshold for big-warnings (default: 1e9)')
+    return parser
+
+def write_timings(args, file_timings, wall):
+    if args.timings:
+        with open(args.timings, 'w', encoding='utf-8') as f:
+            json.dump({'wall_seconds': wall, 'jobs': args.jobs, 'files': file_timings}, f, indent=2)
+
+def open_output(args):
+    return open(args.output, 'w', encoding='utf-8', newline='') if args.output else sys.stdout
+
+def run_query(args):
+    archive = SessionArchive(args.db)
+    try:
+        columns, rows = archive.query(args.query, query_params(args.days, args.limit, args.min_damage))
+    except sqlite3.Error as e:
+        print(f'Query failed: {e}', file=sys.stderr)
+        return 1
+    finally:
+        archive.close()
+    out = open_output(args)
+    try:
+        if args.format == 'csv':
+            writer = csv.writer(out, lineterminator='\n')
+            writer.writerow(columns)
+            writer.writerows(rows)
+        else:
+            for row in rows:
+                out.write(json.dumps(dict(zip(columns, row))) + '\n')
+    finally:
+        if out is not sys.stdout:
+            out.close()
+    return 0
+
+def archive_logs(args, paths):
+    archive = SessionArchive(args.db)
+    failed = skipped = stored = dropped = short = total_bytes = 0
+    file_timings = []
+    wall_start = time.perf_counter()
+    try:
+        todo = []
+        for path in paths:
+            try:
+                current = archive.is_current(path)
+            except OSError as e:
+                print(f'{path}: {e}', file=sys.stderr)
+                failed += 1
+                continue
+            if current:
+                skipped += 1
+            else:
+                todo.append(path)
+
+        options = {'keyword_filter': not args.all_warnings, 'mode': args.mode, 'rules': args.rules,
+                   'jobs': args.jobs, 'timings': bool(args.timings), 'profile': args.profile}
+        jobs = file_jobs(args, len(todo))
+        executor = ProcessPoolExecutor(jobs) if jobs > 1 else None
+        try:
+            if executor:
+                results = executor.map(parse_for_archive, todo, repeat(options))
+            else:
+                results = (parse_for_archive(path, options) for path in todo)
+            # Inserts happen here, one transaction per log, as the workers finish
+            for path, parser, seconds, timings in results:
+                if isinstance(parser, str):
+                    failed += 1
+                    print(f'{path}: {parser}', file=sys.stderr)
+                    continue
+                start = time.perf_counter()
+                try:
+                    added = archive.ingest_parser(parser)
+                except ValueError as e:
+                    # Too short to tell it from other logs yet
+                    print(f'{path}: {e}', file=sys.stderr)
+                    short += 1
+                    continue
+                if timings:
+                    timings['phases']['ingest'] = {'seconds': time.perf_counter() - start, 'calls': 1}
+                    file_timings.append({'file': path, **timings})
+                if added:
+                    stored += 1
+                else:
+                    dropped += 1
+                total_bytes += parser.position
+                if not args.quiet:
+                    print(f"{path}: {len(parser.combat_events)} combat events, "
+                          f"{len(parser.warning_groups)} warning groups, "
+                          f"{throughput(parser.position, seconds)}"
+                          + ('' if added else ', a copy at least as long is already stored'), file=sys.stderr)
+        finally:
+            if executor:
+                executor.shutdown()
+    finally:
+        archive.close()
+
+    wall = time.perf_counter() - wall_start
+    write_timings(args, file_timings, time.perf_counter() - wall_start)
+    print(f"Archived {stored} files into {archive.path}, {throughput(total_bytes, wall)}"
+          + (f", {skipped} already current" if skipped else '')
+          + (f", {dropped} already stored from a copy at least as long" if dropped else '')
+          + (f", {short} too short to archive yet" if short else '')
+          + (f", {failed} failed" if failed else ''), file=sys.stderr)
+    return 1 if failed else 0
+
+def main(argv=None):
+    arg_parser = build_arg_parser()
+    args = arg_parser.parse_args(argv)
+    if args.query:
+        return run_query(args)
+    if not args.paths:
+        arg_parser.error('no log files given')
+    paths = list(expand_paths(args.paths))
+    if not paths:
+        print('No log files found.', file=sys.stderr)
+        return 1
+    try:
+        # From here on args.rules holds the loaded config
+        args.rules = load_rules(args.rules) if args.rules else default_rules()
+    except (OSError, ValueError) as e:
+        print(f'Bad rules: {e}', file=sys.stderr)
+        return 1
+    if args.archive:
+        return archive_logs(args, paths)
+
+    out = open_output(args)
+    failed = total_bytes = 0
+    parse_seconds = 0.0
+    file_timings = []
+    wall_start = time.perf_counter()
+    try:
+        if args.format == 'csv':
+            write_csv((), out, header=True)
+        with tempfile.TemporaryDirectory() as tmpdir:
+            options = {
+                'keyword_filter': not args.all_warnings,
+                'utc': args.utc,
+                'rules': args.rules,
+                'mode': args.mode,
+                'format': args.format,
+                'tmpdir': tmpdir,
+                'jobs': args.jobs,
+                'timings': bool(args.timings),
+                'profile': args.profile
+            }
+            jobs = file_jobs(args, len(paths))
+            executor = ProcessPoolExecutor(jobs) if jobs > 1 else None
+            try:
+                if executor:
+                    results = executor.map(parse_to_file, paths, repeat(options))
+                else:
+                    results = (parse_to_file(path, options) for path in paths)
+                for result in results:
+                    if 'Error' in result:
+                        failed += 1
+                        print(f"{result['File']}: {result['Error']}", file=sys.stderr)
+                        continue
+                    with open(result['Part'], encoding='utf-8', newline='') as part:
+                        shutil.copyfileobj(part, out)
+                    os.remove(result['Part'])
+                    total_bytes += result['Bytes']
+                    parse_seconds += result['Seconds']
+                    if result['Timings']:
+                        file_timings.append({'file': result['File'], **result['Timings']})
+                    if not args.quiet:
+                        print(f"{result['File']}: {result['CombatEvents']} combat events, "
+                              f"{result['WarningGroups']} warning groups, "
+                              f"{throughput(result['Bytes'], result['Seconds'])}", file=sys.stderr)
+            finally:
+                if executor:
+                    executor.shutdown()
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    wall = time.perf_counter() - wall_start
+    write_timings(args, file_timings, wall)
+    print(f"Total: {len(paths) - failed} files, {throughput(total_bytes, wall)}, "
+          f"{parse_seconds:.2f}s of parsing across {args.jobs if args.mode == 'parallel' else jobs} worker(s)"
+          + (f", {failed} failed" if failed else ''), file=sys.stderr)
+    return 1 if failed else 0
+
+if __name__ == '__main__':
+    try:
+        sys.exit(main())
+    except BrokenPipeError:
+        # Output piped into head and friends; silence the flush at exit
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+        sys.exit(1)
@@ -0,0 +1,68 @@
+import csv
+import json
+from itertools import islice
+
+CHUNK_ROWS = 4096   # records per write and per progress report
+
+COMBAT_FIELDS = ('Offset', 'Time', 'Victim', 'State', 'Health', 'Damage', 'Value', 'Source', 'Message')
+WARNING_FIELDS = ('Offset', 'Time', 'Count', 'MaxDamage')
+MESSAGE_FIELDS = ('Message', 'Damage', 'Value')
+MATCH_FIELDS = ('Offset', 'Time', 'Rule', 'Message', 'Fields')
+
+# CSV columns of a single-tab export; warnings get one row per message
+COMBAT_COLUMNS = list(COMBAT_FIELDS)
+WARNING_COLUMNS = list(WARNING_FIELDS + MESSAGE_FIELDS)
+
+def combat_record(event):
+    return {key: event[key] for key in COMBAT_FIELDS}
+
+def warning_record(group):
+    record = {key: group[key] for key in WARNING_FIELDS}
+    record['Messages'] = [{key: child[key] for key in MESSAGE_FIELDS} for child in group['Children']]
+    return record
+
+def match_record(event):
+    return {key: event[key] for key in MATCH_FIELDS}
+
+def flatten(records):
+    """CSV rows for records: one per message for warnings, as is otherwise."""
+    for record in records:
+        messages = record.get('Messages')
+        if messages is None:
+            yield record
+        else:
+            for message in messages:
+                yield {**record, **message}
+
+def write_chunks(records, write, progress=None, total=0):
+    """Pass records to write in lists of CHUNK_ROWS, calling progress(done,
+    total) after each; returns the number of records written.
+
+    Only one chunk is held at a time, so an export streams however many
+    rows there are. progress may raise to abandon the export.
+    """
+    done = 0
+    it = iter(records)
+    while chunk := list(islice(it, CHUNK_ROWS)):
+        write(chunk)
+        done += len(chunk)
+        if progress:
+            progress(done, total)
+    return done
+
+def write_ndjson(records, f, progress=None, total=0):
+    encode = json.JSONEncoder().encode
+    return write_chunks(records, lambda chunk: f.write(''.join(encode(r) + '\n' for r in chunk)),
+                        progress, total)
+
+def write_csv(records, f, columns, header=True, progress=None, total=0):
+    writer = csv.DictWriter(f, columns, extrasaction='ignore', lineterminator='\n')
+    if header:
+        writer.writeheader()
+    return write_chunks(records, lambda chunk: writer.writerows(flatten(chunk)), progress, total)
+
+def write_records(records, f, fmt, columns, progress=None, total=0):
+    """Write records to f as 'csv' (with a header of columns) or 'ndjson'."""
+    if fmt == 'ndjson':
+        return write_ndjson(records, f, progress, total)
+    return write_csv(records, f, columns, progress=progress, total=total)
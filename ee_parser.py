@@ -0,0 +1,777 @@
+import re
+import os
+import sys
+import math
+import mmap
+from concurrent.futures import ProcessPoolExecutor
+from array import array
+from itertools import islice
+from datetime import datetime
+from pathlib import Path
+
+from ee_profile import NO_TIMER
+from ee_rules import compile_rules
+
+# Lines are classified by the rules in ee_rules; the parser only needs the
+# offset at the start of a line for the end time
+ts_rx = re.compile(r'^([0-9\.]+)')
+PARALLEL_CHUNK = 32 * 1024 * 1024   # smallest byte range given to a worker process
+PROGRESS_STEP = 1024 * 1024  # bytes parsed between progress callbacks
+SEGMENT_ROWS = 16384    # rows a store takes before retire() starts a new one
+TS_CHARS = '0123456789.'
+# Bump whenever parsing rules or the store layout change, so results pickled
+# by an older parser (see ee_cache) are thrown away instead of reused
+PARSER_VERSION = 3
+
+class Row:
+    """Dict-shaped view of one record of a store.
+
+    Values are looked up (and Time/Message formatted) only when a key is
+    read. Two views of the same record compare equal.
+    """
+
+    __slots__ = ('store', 'index')
+    fields = {}
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+
+    def __getitem__(self, key):
+        return self.fields[key](self.store, self.index)
+
+    def get(self, key, default=None):
+        return self.fields[key](self.store, self.index) if key in self.fields else default
+
+    def keys(self):
+        return self.fields.keys()
+
+    def as_dict(self):
+        return {key: self[key] for key in self.fields}
+
+    def __eq__(self, other):
+        return type(other) is type(self) and other.store is self.store and other.index == self.index
+
+    def __hash__(self):
+        return hash((id(self.store), self.index))
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.as_dict()!r})"
+
+class CombatEvent(Row):
+    __slots__ = ()
+    fields = {
+        'Type': lambda s, i: 'Combat',
+        'Offset': lambda s, i: s.offsets[i],
+        'Time': lambda s, i: s.clock(s.offsets[i]),
+        'Victim': lambda s, i: s.victims[i],
+        'State': lambda s, i: s.states[i],
+        'Damage': lambda s, i: s.damages[i],
+        'Health': lambda s, i: s.healths[i],
+        'Source': lambda s, i: s.sources[i],
+        'Message': lambda s, i: s.message(i),
+        'Value': lambda s, i: s.values[i],
+    }
+
+class WarningMessage(Row):
+    __slots__ = ()
+    fields = {
+        'Offset': lambda s, m: s.offsets[s.groups[m]],
+        'Time': lambda s, m: s.clock(s.offsets[s.groups[m]]),
+        'Message': lambda s, m: s.texts[m],
+        'Damage': lambda s, m: f"{s.damage[m]:.2e}" if s.damage[m] == s.damage[m] else '',
+        'Value': lambda s, m: s.damage[m] if s.damage[m] == s.damage[m] else 0,
+    }
+
+class WarningGroup(Row):
+    __slots__ = ()
+    fields = {
+        'Type': lambda s, g: 'WarningGroup',
+        'Offset': lambda s, g: s.offsets[g],
+        'Time': lambda s, g: s.clock(s.offsets[g]),
+        'Count': lambda s, g: s.counts[g],
+        'MaxDamage': lambda s, g: s.max_damage[g],
+        'Messages': lambda s, g: [s.texts[m] for m in s.messages(g)],
+        'Children': lambda s, g: [WarningMessage(s, m) for m in s.messages(g)],
+    }
+
+class MatchEvent(Row):
+    __slots__ = ()
+    fields = {
+        'Type': lambda s, i: 'Match',
+        'Offset': lambda s, i: s.offsets[i],
+        'Time': lambda s, i: s.clock(s.offsets[i]),
+        'Rule': lambda s, i: s.rules[i],
+        'Message': lambda s, i: s.texts[i],
+        'Fields': lambda s, i: dict(zip(s.names[s.rules[i]], s.fields[i])),
+    }
+
+class CombatStore:
+    """Combat events as parallel arrays, one slot per event.
+
+    Repeated strings (victims, sources, states) are interned. clock turns an
+    offset into the displayed time.
+    """
+
+    __slots__ = ('offsets', 'values', 'victims', 'states', 'damages', 'healths', 'sources', 'clock')
+
+    def __init__(self, clock):
+        self.offsets = array('d')
+        self.values = array('d')
+        self.victims = []
+        self.states = []
+        self.damages = []
+        self.healths = []
+        self.sources = []
+        self.clock = clock
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def append(self, off, victim, state, damage, health, source):
+        self.offsets.append(off)
+        self.values.append(float(damage) if damage.replace('.', '').isdigit() else 0)
+        self.victims.append(sys.intern(victim))
+        self.states.append(sys.intern(state))
+        self.damages.append(damage)
+        self.healths.append(sys.intern(health))
+        self.sources.append(sys.intern(source))
+        return CombatEvent(self, len(self.offsets) - 1)
+
+    def extend(self, other):
+        """Append the events of other; returns the index of the first here."""
+        base = len(self.offsets)
+        self.offsets.extend(other.offsets)
+        self.values.extend(other.values)
+        self.victims.extend(map(sys.intern, other.victims))
+        self.states.extend(map(sys.intern, other.states))
+        self.damages.extend(other.damages)
+        self.healths.extend(map(sys.intern, other.healths))
+        self.sources.extend(map(sys.intern, other.sources))
+        return base
+
+    def message(self, i):
+        return combat_message(self.clock(self.offsets[i]), self.victims[i], self.states[i],
+                              self.damages[i], self.healths[i], self.sources[i])
+
+def combat_message(t, victim, state, damage, health, source):
+    if state == "downed":
+        return f"{t} - <{victim}> downed at {health} health {source.replace('from a', 'by a')}"
+    return f"{t} - <{victim}> {state} by {damage} damage at {health} health {source}"
+
+class WarningStore:
+    """Warning groups and their messages as parallel arrays.
+
+    Each message text is stored once; the messages of a group are chained
+    through next (-1 ends the chain) so a group needs no list of its own.
+    Messages without a 'high dmg' value have NaN damage.
+    """
+
+    __slots__ = ('offsets', 'counts', 'max_damage', 'first', 'last',
+                 'texts', 'damage', 'groups', 'next', 'clock')
+
+    def __init__(self, clock):
+        self.offsets = array('d')
+        self.counts = array('I')
+        self.max_damage = array('d')
+        self.first = array('i')
+        self.last = array('i')
+        self.texts = []
+        self.damage = array('d')
+        self.groups = array('I')
+        self.next = array('i')
+        self.clock = clock
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def new_group(self, off):
+        self.offsets.append(off)
+        self.counts.append(0)
+        self.max_damage.append(0.0)
+        self.first.append(-1)
+        self.last.append(-1)
+        return WarningGroup(self, len(self.offsets) - 1)
+
+    def add_message(self, g, text, dmg_val=None):
+        m = len(self.texts)
+        self.texts.append(text)
+        self.damage.append(float('nan') if dmg_val is None else dmg_val)
+        self.groups.append(g)
+        self.next.append(-1)
+        if self.last[g] < 0:
+            self.first[g] = m
+        else:
+            self.next[self.last[g]] = m
+        self.last[g] = m
+        self.counts[g] += 1
+        if dmg_val is not None:
+            self.max_damage[g] = max(self.max_damage[g], dmg_val)
+
+    def extend(self, other):
+        """Append the groups and messages of other, renumbered; returns the
+        index of other's first group here."""
+        gbase, mbase = len(self.offsets), len(self.texts)
+        self.offsets.extend(other.offsets)
+        self.counts.extend(other.counts)
+        self.max_damage.extend(other.max_damage)
+        for mine, theirs in ((self.first, other.first), (self.last, other.last), (self.next, other.next)):
+            mine.extend(array('i', (m + mbase if m >= 0 else -1 for m in theirs)))
+        self.texts.extend(other.texts)
+        self.damage.extend(other.damage)
+        self.groups.extend(array('I', (g + gbase for g in other.groups)))
+        return gbase
+
+    def join(self, g, h):
+        """Move the messages of group h to the end of group g."""
+        if self.first[h] < 0:
+            return
+        for m in self.messages(h):
+            self.groups[m] = g
+        if self.last[g] < 0:
+            self.first[g] = self.first[h]
+        else:
+            self.next[self.last[g]] = self.first[h]
+        self.last[g] = self.last[h]
+        self.counts[g] += self.counts[h]
+        self.max_damage[g] = max(self.max_damage[g], self.max_damage[h])
+        self.first[h] = self.last[h] = -1
+        self.counts[h] = 0
+
+    def take(self, g, other, h):
+        """Add the messages of group h of store other to group g, for groups
+        continued across the stores retire() rolls over to."""
+        for m in other.messages(h):
+            value = other.damage[m]
+            self.add_message(g, other.texts[m], value if value == value else None)
+
+    def messages(self, g):
+        m = self.first[g]
+        while m >= 0:
+            yield m
+            m = self.next[m]
+
+class MatchStore:
+    """Lines kept by 'match' rules (see ee_rules) as parallel arrays.
+
+    The fields a rule extracted are stored as a tuple; names maps each rule
+    name to its field names, so a match needs no dict of its own.
+    """
+
+    __slots__ = ('offsets', 'rules', 'texts', 'fields', 'names', 'clock')
+
+    def __init__(self, clock):
+        self.offsets = array('d')
+        self.rules = []
+        self.texts = []
+        self.fields = []
+        self.names = {}
+        self.clock = clock
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def append(self, off, rule, text, fields):
+        self.offsets.append(off)
+        self.rules.append(sys.intern(rule))
+        self.texts.append(text)
+        self.fields.append(tuple(fields.values()))
+        self.names.setdefault(rule, tuple(fields))
+        return MatchEvent(self, len(self.offsets) - 1)
+
+    def extend(self, other):
+        base = len(self.offsets)
+        self.offsets.extend(other.offsets)
+        self.rules.extend(map(sys.intern, other.rules))
+        self.texts.extend(other.texts)
+        self.fields.extend(other.fields)
+        for rule, names in other.names.items():
+            self.names.setdefault(rule, names)
+        return base
+
+def as_dicts(rows):
+    """Plain dict copies of store rows, warning children included."""
+    dicts = []
+    for row in rows:
+        d = row.as_dict()
+        if 'Children' in d:
+            d['Children'] = [child.as_dict() for child in d['Children']]
+        dicts.append(d)
+    return dicts
+
+class TimeFormatter:
+    """Formats log offsets as "%H:%M:%S" for display.
+
+    The parser only stores offsets and the session start time; the timezone
+    is a render-time setting, so switching use_utc needs no re-parse.
+    Results are memoized per wall-clock second.
+    """
+
+    CACHE_LIMIT = 100000
+
+    def __init__(self, start_time=0.0, use_utc=False):
+        self.start_time = start_time
+        self.use_utc = use_utc
+        self.caches = ({}, {})  # local, utc
+
+    def __call__(self, off):
+        second = math.floor(self.start_time + off)
+        cache = self.caches[self.use_utc]
+        t = cache.get(second)
+        if t is None:
+            if len(cache) > self.CACHE_LIMIT:
+                cache.clear()
+            t_format = datetime.utcfromtimestamp if self.use_utc else datetime.fromtimestamp
+            t = cache[second] = t_format(second).strftime("%H:%M:%S")
+        return t
+
+    def __getstate__(self):
+        return {'start_time': self.start_time, 'use_utc': self.use_utc}
+
+    def __setstate__(self, state):
+        self.__init__(**state)
+
+class LogParser:
+    """Parses an EE.log incrementally.
+
+    The parser remembers how many bytes of the file it has consumed, so each
+    call to update() only reads and parses what the game appended since the
+    previous call. Combat events, warning groups and rule matches are
+    merged into the results accumulated so far.
+
+    rules is a user rule config from ee_rules.load_rules(), or None for the
+    built-in rules only.
+    """
+
+    def __init__(self, file_path, min_keyword_filter=True, use_utc=False, rules=None):
+        self.file_path = file_path
+        self.min_keyword_filter = min_keyword_filter
+        self.rules = rules
+        self.ruleset = compile_rules(rules, min_keyword_filter)
+        self.clock = TimeFormatter(use_utc=use_utc)
+        self.reset()
+
+    def reset(self):
+        self.position = 0       # bytes of the file consumed so far
+        self.pending = b''      # trailing partial line waiting for its newline
+        self.player_name = None
+        self.start_time = None
+        self.last_line = None   # last timestamped line, for the end time
+        self.combat = CombatStore(self.clock)
+        self.warnings = WarningStore(self.clock)
+        self.matches = MatchStore(self.clock)
+        self.combat_events = []
+        self.warning_groups = {}
+        self.match_events = []
+        self.event_offsets = set()
+        self.retired = {'CombatEvents': 0, 'WarningGroups': 0, 'Matches': 0}
+
+    def __getstate__(self):
+        # The row adapters are rebuilt from the stores rather than pickled
+        # one object at a time; every stored combat event is listed, while
+        # groups superseded by a combat event stay in the store unlisted
+        state = self.__dict__.copy()
+        del state['combat_events'], state['match_events'], state['ruleset']
+        state['warning_groups'] = array('I', (g.index for g in self.warning_groups.values()))
+        state['event_offsets'] = array('d', self.event_offsets)
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self.ruleset = compile_rules(self.rules, self.min_keyword_filter)
+        self.combat_events = [CombatEvent(self.combat, i) for i in range(len(self.combat))]
+        self.match_events = [MatchEvent(self.matches, i) for i in range(len(self.matches))]
+        self.warning_groups = {self.warnings.offsets[i]: WarningGroup(self.warnings, i)
+                               for i in state['warning_groups']}
+        self.event_offsets = set(state['event_offsets'])
+
+    # Hooks timed by update(timer=...); the rest of the scan counts as 'match'
+    timed_methods = {'_record_event': 'events', '_record_warning': 'warnings'}
+
+    @staticmethod
+    def new_delta():
+        return {'Reset': False, 'CombatEvents': [], 'WarningGroups': [],
+                'UpdatedGroups': [], 'RemovedGroups': [], 'Matches': []}
+
+    def update(self, final=False, mode='stream', progress=None, timer=None, jobs=None):
+        """Parse the bytes appended since the last call.
+
+        Only complete lines are parsed; a trailing partial line is kept until
+        the rest of it is written, unless final is set. mode is 'stream' to
+        read line by line, 'mmap' to memory-map the file and run bytes regexes
+        over it, or 'parallel' to split the new bytes into ranges parsed by
+        jobs worker processes (default: one per core). progress, if given, is
+        called as progress(done, total) with the bytes parsed so far; it may
+        raise to abort the update. timer, an ee_profile.PhaseTimer, gets the
+        time spent reading, matching and building rows. Returns a delta with
+        the rows added, updated or removed.
+        """
+        timer = timer or NO_TIMER
+        delta = self.new_delta()
+
+        size = os.path.getsize(self.file_path)
+        if size < self.position:
+            # The file was truncated (game restart), start over
+            self.reset()
+            delta['Reset'] = True
+        if self.start_time is None and self.position == 0:
+            self.fallback_start = self.clock.start_time = Path(self.file_path).stat().st_mtime
+
+        # Groups touched by this update, mapped to whether they are new
+        self._delta, self._touched = delta, {}
+        with timer.profiling(), timer.phase('parse', bytes=size - self.position), \
+                timer.instrument(self, self.timed_methods), open(self.file_path, 'rb') as f:
+            if mode == 'mmap':
+                self._scan_mmap(f, final, progress)
+            elif mode == 'parallel':
+                self._scan_parallel(f, final, progress, timer, jobs)
+            else:
+                f.seek(self.position)
+                lines = self._read_lines(f, final, progress, size - self.position)
+                for line in timer.timed_iter('read', lines, 'lines'):
+                    self._classify(line)
+                self.position = f.tell()
+        timer.remainder('match', 'parse', ('read', 'events', 'warnings', 'merge'))
+
+        for off, is_new in self._touched.items():
+            if group := self.warning_groups.get(off):
+                delta['WarningGroups' if is_new else 'UpdatedGroups'].append(group)
+        del self._delta, self._touched
+        return delta
+
+    def _read_lines(self, f, final, progress=None, total=0):
+        # Stream decoded lines, holding back an unterminated last line
+        done = next_report = 0
+        for raw in f:
+            if progress:
+                done += len(raw)
+                if done >= next_report:
+                    progress(done, total)
+                    next_report = done + PROGRESS_STEP
+            if self.pending:
+                raw, self.pending = self.pending + raw, b''
+            if not raw.endswith(b'\n') and not final:
+                self.pending = raw
+                return
+            yield raw.decode('utf-8', errors='ignore').rstrip('\r\n')
+
+    def _classify(self, line):
+        # Every line is "<offset> <Category> [<Level>]: <message>"; the rules
+        # of the part between the offset and the colon say what it is
+        if not line or line[0] not in TS_CHARS:
+            return
+        self.last_line = line
+        sp = line.find(' ')
+        end = line.find(']', sp) + 1
+        match = self.ruleset.channels.get(line[sp + 1:end])
+        if match and (m := match(line, end)) and not line[:sp].strip(TS_CHARS):
+            rule, fields = self.ruleset.extract(m)
+            self.actions[rule.action](self, line[:sp], rule, fields, line[m.end(1):])
+
+    def _scan_mmap(self, f, final, progress=None, stop=None):
+        # Find the lines of channels with rules by running the rule set's
+        # bytes regex over the mapped file; only those lines are decoded.
+        # stop ends the scan before the end of the file
+        start = self.position - len(self.pending)
+        size = os.fstat(f.fileno()).st_size if stop is None else stop
+        if size <= start:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            end = size if final else mm.rfind(b'\n', start, size) + 1
+            next_report = start
+            for m in self.ruleset.scan_rx.finditer(mm, start, max(end, start)):
+                if progress and m.start() >= next_report:
+                    progress(m.start() - start, size - start)
+                    next_report = m.start() + PROGRESS_STEP
+                stop = mm.find(b'\n', m.end(), end)
+                line = mm[m.start():stop if stop >= 0 else end]
+                self._classify(line.decode('utf-8', errors='ignore').rstrip('\r\n'))
+
+            # End time comes from the last timestamped line in the new data
+            stop = end
+            while stop > start:
+                begin = mm.rfind(b'\n', start, stop - 1) + 1 or start
+                if begin < stop and mm[begin] in TS_CHARS.encode():
+                    self.last_line = mm[begin:stop].decode('utf-8', errors='ignore').rstrip('\r\n')
+                    break
+                stop = begin
+
+            self.pending = mm[max(end, start):size]
+            self.position = size
+
+    def _scan_parallel(self, f, final, progress=None, timer=NO_TIMER, jobs=None):
+        # Parse line-aligned ranges of the new bytes in worker processes and
+        # merge them back in file order, see parse_range() and _merge()
+        start = self.position - len(self.pending)
+        size = os.fstat(f.fileno()).st_size
+        if size <= start:
+            return
+        jobs = jobs or os.cpu_count() or 1
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            end = size if final else mm.rfind(b'\n', start, size) + 1
+            # A few ranges per worker even out the ones that parse slower
+            parts = max(1, min(jobs * 4, (end - start) // PARALLEL_CHUNK))
+            bounds = [start]
+            for k in range(1, parts):
+                cut = mm.find(b'\n', start + (end - start) * k // parts, end) + 1
+                if cut > bounds[-1]:
+                    bounds.append(cut)
+            if end > bounds[-1]:
+                bounds.append(end)
+            pending = mm[max(end, start):size]
+        ranges = list(zip(bounds, bounds[1:]))
+
+        if len(ranges) == 1:
+            self._scan_mmap(f, True, progress, end)
+        elif ranges:
+            executor = ProcessPoolExecutor(min(jobs, len(ranges)))
+            try:
+                futures = [executor.submit(parse_range, self.file_path, a, b, self.min_keyword_filter, self.rules)
+                           for a, b in ranges]
+                for future, (a, b) in zip(futures, ranges):
+                    chunk = future.result()
+                    with timer.phase('merge'):
+                        self._merge(chunk)
+                    if progress:
+                        progress(b - start, size - start)
+            finally:
+                executor.shutdown(wait=False, cancel_futures=True)
+        self.pending = pending
+        self.position = size
+
+    def _merge(self, chunk):
+        # Fold in a parser of the byte range that follows everything parsed
+        # so far, as if its lines had been classified here
+        if self.player_name is None:
+            self.player_name = chunk.player_name
+        if self.start_time is None and chunk.start_time is not None:
+            self.start_time = self.clock.start_time = chunk.start_time
+        if chunk.last_line is not None:
+            self.last_line = chunk.last_line
+
+        # Its combat events supersede warnings of earlier ranges at their offsets
+        for off in chunk.event_offsets:
+            if (group := self.warning_groups.pop(off, None)) is not None:
+                if not self._touched.pop(off, False):
+                    self._delta['RemovedGroups'].append(group)
+        self.event_offsets |= chunk.event_offsets
+
+        base = self.combat.extend(chunk.combat)
+        events = [CombatEvent(self.combat, i) for i in range(base, len(self.combat))]
+        self.combat_events += events
+        self._delta['CombatEvents'] += events
+        base = self.matches.extend(chunk.matches)
+        events = [MatchEvent(self.matches, i) for i in range(base, len(self.matches))]
+        self.match_events += events
+        self._delta['Matches'] += events
+
+        # Groups at an offset seen before (one cut in two by the range
+        # boundary) continue the earlier group
+        base = self.warnings.extend(chunk.warnings)
+        for off, group in chunk.warning_groups.items():
+            if off in self.event_offsets:
+                continue
+            self._touched.setdefault(off, off not in self.warning_groups)
+            if (earlier := self.warning_groups.get(off)) is not None:
+                if earlier.store is self.warnings:
+                    self.warnings.join(earlier.index, base + group.index)
+                else:
+                    earlier.store.take(earlier.index, self.warnings, base + group.index)
+            else:
+                self.warning_groups[off] = WarningGroup(self.warnings, base + group.index)
+
+    def _on_combat(self, offset, rule, fields, text):
+        self._record_event(offset, fields['victim'], fields['state'], fields['damage'],
+                           fields.get('source'), fields.get('health'), rule.hide)
+
+    def _on_warning(self, offset, rule, fields, text):
+        self._record_warning(offset, text, fields.get('damage'))
+
+    def _on_match(self, offset, rule, fields, text):
+        self._record_match(offset, rule.name, text, fields)
+
+    def _on_login(self, offset, rule, fields, text):
+        self._record_login(fields['player'])
+
+    def _on_diag(self, offset, rule, fields, text):
+        self._record_diag(offset, fields['utc'])
+
+    def _on_ignore(self, offset, rule, fields, text):
+        pass
+
+    def _record_login(self, name):
+        # Player name detection
+        if self.player_name is None:
+            self.player_name = name
+
+    def _record_diag(self, offset, utc_text):
+        # Start time detection
+        if self.start_time is None:
+            utc_dt = datetime.strptime(utc_text, "%a %b %d %H:%M:%S %Y")
+            self.start_time = self.clock.start_time = utc_dt.timestamp() - float(offset)
+
+    def _record_event(self, offset, victim, state, damage_info, source, health=None, hide=False):
+        off = float(offset)
+        self.event_offsets.add(off)
+        # A combat event supersedes warnings logged at the same offset
+        if (group := self.warning_groups.pop(off, None)) is not None:
+            if not self._touched.pop(off, False):
+                self._delta['RemovedGroups'].append(group)
+
+        if hide:
+            return
+        event = self._make_event(off, victim, state, damage_info, source, health)
+        self.combat_events.append(event)
+        self._delta['CombatEvents'].append(event)
+
+    def _record_warning(self, offset, text, damage=None):
+        off = float(offset)
+        if off in self.event_offsets:
+            return
+        self._touched.setdefault(off, off not in self.warning_groups)
+        self._add_warning(off, text.strip(), damage)
+
+    def _record_match(self, offset, rule, text, fields):
+        event = self.matches.append(float(offset), rule, text.strip(), fields)
+        self.match_events.append(event)
+        self._delta['Matches'].append(event)
+
+    actions = {
+        'combat': _on_combat,
+        'warning': _on_warning,
+        'match': _on_match,
+        'login': _on_login,
+        'diag': _on_diag,
+        'ignore': _on_ignore,
+    }
+
+    @property
+    def last_offset(self):
+        if self.last_line and (m := ts_rx.match(self.last_line)):
+            return float(m.group(1))
+        return None
+
+    @property
+    def base_time(self):
+        # The diag line is written at startup, before anything we parse, so
+        # the file mtime fallback only sticks for logs that lack it entirely
+        return self.start_time if self.start_time is not None else self.fallback_start
+
+    def _make_event(self, off, victim, state, damage_info, source, health=None):
+        source = source.strip() if source else 'from an unknown source'
+
+        # Health/damage split, unless the rule extracted the health itself
+        damage = damage_info
+        if health is None:
+            health = "unknown"
+            if " / " in damage_info:
+                parts = damage_info.split(" / ")
+                if len(parts) == 2:
+                    health, damage = parts
+
+        return self.combat.append(off, victim, state, damage, health, source)
+
+    def _add_warning(self, off, text, damage=None):
+        group = self.warning_groups.get(off)
+        if group is None:
+            group = self.warning_groups[off] = self.warnings.new_group(off)
+
+        dmg_val = None
+        if damage:
+            try:
+                dmg_val = float(damage)
+            except ValueError:
+                pass  # e.g. a bare 'high dmg: -', kept without a value
+        # A group may still be in a store retire() has moved on from
+        group.store.add_message(group.index, text, dmg_val)
+
+    def retire(self, before=None, keep=None, slack=1):
+        """Drop the oldest rows from memory, so a live session stays bounded.
+
+        Rows at offsets below before go, then the oldest rows of each kind
+        beyond keep. A kind is only cut once slack of its rows are due, so
+        the lists shrink in batches rather than by one row per update.
+        Returns the retired rows as 'CombatEvents', 'WarningGroups' and
+        'Matches' lists; they stay readable while the caller holds them
+        (to spill them to disk, say), after which their store segments are
+        freed. Counts of what was retired accumulate in self.retired.
+
+        A parser that retired rows no longer holds the whole log, so it
+        must not be cached, pickled or archived.
+        """
+        last = self.last_offset
+
+        def due(rows, total, newest=None):
+            # How many leading rows are too old or too many
+            excess = total - keep if keep is not None else 0
+            n = 0
+            for row in rows:
+                off = row['Offset']
+                if n >= excess and (before is None or off >= before) or newest is not None and off >= newest:
+                    break
+                n += 1
+            return n if n >= slack else 0
+
+        retired = {}
+        if n := due(self.combat_events, len(self.combat_events)):
+            retired['CombatEvents'] = self.combat_events[:n]
+            del self.combat_events[:n]
+        # The group at the last offset may still get messages, so it stays
+        if n := due(self.warning_groups.values(), len(self.warning_groups), last):
+            retired['WarningGroups'] = [self.warning_groups.pop(off) for off in list(islice(self.warning_groups, n))]
+        if n := due(self.match_events, len(self.match_events)):
+            retired['Matches'] = self.match_events[:n]
+            del self.match_events[:n]
+        if not retired:
+            return retired
+
+        # Warnings never arrive for offsets older than what was retired
+        floor = max(rows[-1]['Offset'] for rows in retired.values())
+        self.event_offsets = {off for off in self.event_offsets if off >= floor}
+        for key, rows in retired.items():
+            self.retired[key] += len(rows)
+        # Segments fill up and start afresh; a full one is freed along with
+        # the last of its rows
+        if len(self.combat) >= SEGMENT_ROWS:
+            self.combat = CombatStore(self.clock)
+        if len(self.warnings) >= SEGMENT_ROWS:
+            self.warnings = WarningStore(self.clock)
+        if len(self.matches) >= SEGMENT_ROWS:
+            self.matches = MatchStore(self.clock)
+        return retired
+
+    def header(self):
+        """The session header: player and start and end times."""
+        end_time = self.base_time + self.last_offset if self.last_offset is not None else self.base_time
+        return {
+            'Player': self.player_name or '',
+            'LogStart': datetime.fromtimestamp(self.base_time).strftime('%Y-%m-%d %H:%M:%S'),
+            'LogEnd': datetime.fromtimestamp(end_time).strftime('%Y-%m-%d %H:%M:%S'),
+        }
+
+    def result(self):
+        return {
+            **self.header(),
+            'CombatEvents': list(self.combat_events),
+            'WarningGroups': list(self.warning_groups.values()),
+            'Matches': list(self.match_events)
+        }
+
+def parse_range(file_path, start, stop, min_keyword_filter=True, rules=None):
+    """Parse the lines in bytes [start, stop) of file_path on their own.
+
+    Runs in the worker processes of update(mode='parallel'); start and stop
+    must fall on line starts. Returns the LogParser, for LogParser._merge().
+    """
+    parser = LogParser(file_path, min_keyword_filter, rules=rules)
+    parser.position = start
+    parser._delta, parser._touched = parser.new_delta(), {}
+    with open(file_path, 'rb') as f:
+        parser._scan_mmap(f, True, stop=stop)
+    del parser._delta, parser._touched
+    return parser
+
+def parse_log(file_path, min_keyword_filter=True, use_utc=False, mode='stream', timer=None, rules=None, jobs=None):
+    parser = LogParser(file_path, min_keyword_filter, use_utc, rules)
+    parser.update(final=True, mode=mode, timer=timer, jobs=jobs)
+    return parser.result()
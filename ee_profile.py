@@ -0,0 +1,192 @@
+import os
+import json
+import time
+import pstats
+import cProfile
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+_MISSING = object()
+
+class PhaseTimer:
+    """Wall time and counters accumulated per named phase.
+
+    Phases may nest; each keeps its own total, so an outer phase includes
+    the inner ones. A disabled timer hands out null contexts and leaves
+    iterators and methods unwrapped, so instrumented code costs next to
+    nothing while nobody is looking.
+
+    Setting capture to 'cprofile' or 'tracemalloc' makes the next
+    profiling() block record a profile into self.profile, after which
+    capture goes back to None.
+    """
+
+    PROFILE_LIMIT = 25  # functions or allocation sites kept per profile
+
+    def __init__(self, enabled=True):
+        self.enabled = enabled
+        self.capture = None
+        self.reset()
+
+    def reset(self):
+        self.phases = {}
+        self.profile = None
+
+    def _entry(self, name):
+        entry = self.phases.get(name)
+        if entry is None:
+            entry = self.phases[name] = {'seconds': 0.0, 'calls': 0}
+        return entry
+
+    def add(self, name, seconds, **counts):
+        entry = self._entry(name)
+        entry['seconds'] += seconds
+        entry['calls'] += 1
+        for key, value in counts.items():
+            entry[key] = entry.get(key, 0) + value
+
+    def count(self, name, **counts):
+        if self.enabled:
+            entry = self._entry(name)
+            for key, value in counts.items():
+                entry[key] = entry.get(key, 0) + value
+
+    def phase(self, name, **counts):
+        """Context manager timing one run of the phase name."""
+        if not self.enabled:
+            return nullcontext()
+        return self._phase(name, counts)
+
+    @contextmanager
+    def _phase(self, name, counts):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start, **counts)
+
+    def timed_iter(self, name, iterable, unit='items'):
+        """Charge the time spent producing each item of iterable to name."""
+        if not self.enabled:
+            return iterable
+        return self._timed_iter(self._entry(name), iter(iterable), unit)
+
+    @staticmethod
+    def _timed_iter(entry, it, unit):
+        entry['calls'] += 1
+        entry.setdefault(unit, 0)
+        clock = time.perf_counter
+        while True:
+            start = clock()
+            try:
+                item = next(it)
+            except StopIteration:
+                entry['seconds'] += clock() - start
+                return
+            entry['seconds'] += clock() - start
+            entry[unit] += 1
+            yield item
+
+    def timed(self, name, func):
+        """Wrap func so every call is charged to the phase name."""
+        entry = self._entry(name)
+        clock = time.perf_counter
+
+        def timed_func(*args, **kwargs):
+            start = clock()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                entry['seconds'] += clock() - start
+                entry['calls'] += 1
+        return timed_func
+
+    @contextmanager
+    def instrument(self, obj, methods):
+        """Time obj's attributes for the duration of the block.
+
+        methods maps an attribute name to its phase. The originals are put
+        back afterwards, so nothing timed is left behind on the object (or
+        pickled with it).
+        """
+        if not self.enabled:
+            yield
+            return
+        saved = {}
+        for attr, name in methods.items():
+            saved[attr] = vars(obj).get(attr, _MISSING) if hasattr(obj, '__dict__') else getattr(obj, attr)
+            setattr(obj, attr, self.timed(name, getattr(obj, attr)))
+        try:
+            yield
+        finally:
+            for attr, value in saved.items():
+                if value is _MISSING:
+                    delattr(obj, attr)
+                else:
+                    setattr(obj, attr, value)
+
+    def remainder(self, name, total, parts):
+        """Set name to the time of phase total not spent in phases parts."""
+        if self.enabled and total in self.phases:
+            spent = sum(self.phases[p]['seconds'] for p in parts if p in self.phases)
+            entry = self._entry(name)
+            entry['seconds'] = max(0.0, self.phases[total]['seconds'] - spent)
+            entry['calls'] = self.phases[total]['calls']
+
+    @contextmanager
+    def profiling(self):
+        """Record the profile requested through capture, if any, for the block."""
+        kind, self.capture = self.capture, None
+        if kind == 'cprofile':
+            profiler = cProfile.Profile()
+            profiler.enable()
+            try:
+                yield
+            finally:
+                profiler.disable()
+                self.profile = {'kind': kind, 'top': top_functions(profiler, self.PROFILE_LIMIT)}
+        elif kind == 'tracemalloc':
+            tracing = tracemalloc.is_tracing()
+            if not tracing:
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+            try:
+                yield
+            finally:
+                snapshot = tracemalloc.take_snapshot()
+                peak = tracemalloc.get_traced_memory()[1]
+                if not tracing:
+                    tracemalloc.stop()
+                self.profile = {
+                    'kind': kind,
+                    'peak_mb': peak / 2**20,
+                    'top': [{'site': str(stat.traceback[0]), 'size_kb': stat.size / 1024, 'count': stat.count}
+                            for stat in snapshot.statistics('lineno')[:self.PROFILE_LIMIT]]
+                }
+        else:
+            yield
+
+    def snapshot(self):
+        """A JSON-ready copy of the phases and the last profile."""
+        return {'phases': {name: dict(entry) for name, entry in self.phases.items()},
+                'profile': self.profile}
+
+    def summary(self, names=None):
+        """One line with the seconds of each phase, for status bars."""
+        names = names or self.phases
+        return ', '.join(f"{name} {self.phases[name]['seconds']:.3f}s"
+                         for name in names if name in self.phases)
+
+    def save(self, path, **extra):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump({**extra, **self.snapshot()}, f, indent=2)
+
+def top_functions(profiler, limit):
+    # pstats keeps (file, line, name) -> (primitive calls, calls, own, cumulative, callers)
+    stats = pstats.Stats(profiler).stats
+    top = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+    return [{'function': f'{name} ({os.path.basename(filename)}:{line})', 'calls': calls,
+             'own_s': own, 'cumulative_s': cumulative}
+            for (filename, line, name), (_, calls, own, cumulative, _) in top]
+
+NO_TIMER = PhaseTimer(enabled=False)
@@ -0,0 +1,170 @@
+import os
+import re
+import sys
+import json
+import hashlib
+from pathlib import Path
+
+try:
+    import tomllib
+except ImportError:  # Python < 3.11: JSON rule files only
+    tomllib = None
+
+# What a rule does with the lines it matches. The named groups of its
+# pattern are the extracted fields; the built-in actions need the listed
+# ones (optional fields may be left out of the pattern).
+ACTIONS = {
+    'ignore': (),                                   # drop the line
+    'match': (),                                    # keep it as a match event, fields and all
+    'warning': (),                                  # group it with the warnings at its offset
+    'combat': ('victim', 'state', 'damage'),        # + health, source
+    'login': ('player',),
+    'diag': ('utc',),
+}
+
+# The reader's own classification, as rules. User rules are tried first, in
+# file order, then these; within a channel the first rule that matches wins.
+BUILTIN_RULES = [
+    {'name': 'login', 'channel': 'Sys [Info]', 'action': 'login',
+     'pattern': r'Logged in (?P<player>\S+)'},
+    {'name': 'diag', 'channel': 'Sys [Diag]', 'action': 'diag',
+     'pattern': r'Current time: [^\[]+\[UTC: (?P<utc>[^\]]+)\]'},
+    # Razorfly kills still hide the warnings logged with them, but aren't listed
+    {'name': 'razorflies', 'channel': 'Game [Info]', 'action': 'combat', 'hide': True,
+     'pattern': r'(?P<victim>RAZORFLIES) was (?P<state>[^ ]+) by (?P<damage>.+?) damage ?(?P<source>.*)'},
+    {'name': 'combat', 'channel': 'Game [Info]', 'action': 'combat',
+     'pattern': r'(?P<victim>.+?) was (?P<state>[^ ]+) by (?P<damage>.+?) damage ?(?P<source>.*)'},
+    # Sometimes mention damage but are only spam
+    {'name': 'cannot-create', 'channel': 'Game [Warning]', 'action': 'ignore',
+     'pattern': r'\s*Cannot create'},
+    {'name': 'high-dmg', 'channel': 'Game [Warning]', 'action': 'warning',
+     'pattern': r'.*?high dmg:\s*(?P<damage>[0-9\.eE+\-]+)'},
+    {'name': 'damage-warning', 'channel': 'Game [Warning]', 'action': 'warning', 'keyword_filter': True,
+     'pattern': r'(?i:.*?(?:dmg|damage))'},
+    {'name': 'any-warning', 'channel': 'Game [Warning]', 'action': 'warning', 'keyword_filter': False,
+     'pattern': r''},
+]
+
+group_rx = re.compile(r'(?<!\\)\(\?P([<=])(\w+)')
+
+def default_rules_path():
+    if sys.platform == 'win32':
+        base = os.environ.get('APPDATA') or Path.home() / 'AppData' / 'Roaming'
+    else:
+        base = os.environ.get('XDG_CONFIG_HOME') or Path.home() / '.config'
+    return Path(base) / 'ee-log-reader' / 'rules.toml'
+
+def load_rules(path):
+    """Read a rule file (TOML, or JSON if the name ends in .json).
+
+    The file holds a list of rules under 'rule' ([[rule]] tables in TOML)
+    and optionally 'disable', a list of built-in rule names to turn off.
+    Returns the config as plain data for RuleSet and LogParser.
+    """
+    path = Path(path)
+    with open(path, 'rb') as f:
+        if path.suffix.lower() == '.json':
+            config = json.load(f)
+        elif tomllib is None:
+            raise ValueError(f'{path}: TOML rule files need Python 3.11, use JSON instead')
+        else:
+            config = tomllib.load(f)
+    config = {'rule': list(config.get('rule', [])), 'disable': list(config.get('disable', []))}
+    RuleSet(config)  # fail on load rather than on the first parse
+    return config
+
+def default_rules():
+    """The config of the default rule file, or None if there isn't one."""
+    path = default_rules_path()
+    return load_rules(path) if path.exists() else None
+
+def rules_digest(config):
+    """Identifies a config, so results parsed under other rules aren't reused."""
+    text = json.dumps(config or {}, sort_keys=True)
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).hexdigest()
+
+class Rule:
+    __slots__ = ('name', 'channel', 'action', 'hide', 'group', 'fields', 'pattern')
+
+    def __init__(self, spec, index):
+        try:
+            self.name = str(spec['name'])
+            self.channel = spec['channel']
+            self.action = spec.get('action', 'match')
+            pattern = spec['pattern']
+        except (KeyError, TypeError) as e:
+            raise ValueError(f'rule {spec!r} lacks {e}') from None
+        if self.action not in ACTIONS:
+            raise ValueError(f"rule {self.name}: unknown action {self.action!r}, "
+                             f"expected one of {', '.join(ACTIONS)}")
+        try:
+            names = list(re.compile(pattern).groupindex)
+        except re.error as e:
+            raise ValueError(f'rule {self.name}: bad pattern: {e}') from None
+        if missing := [f for f in ACTIONS[self.action] if f not in names]:
+            raise ValueError(f"rule {self.name}: {self.action} rules need the named groups {', '.join(missing)}")
+        self.hide = bool(spec.get('hide', False))
+        # Group names are prefixed so rules can share field names in one regex
+        self.group = f'r{index}'
+        self.fields = tuple(names)
+        self.pattern = group_rx.sub(lambda m: f'(?P{m.group(1)}{self.group}_{m.group(2)}', pattern)
+
+    def __repr__(self):
+        return f'Rule({self.name!r}, {self.channel!r}, {self.action!r})'
+
+class RuleSet:
+    """Line classification rules compiled into one regex per channel.
+
+    A channel is the "<Category> [<Level>]" part of a line, e.g.
+    'Game [Warning]'; the parser looks it up in self.channels, so a line
+    is matched by a single regex however many rules there are. That regex
+    is an alternation of the channel's rules, each a named group, tried
+    in order: m.lastgroup names the rule that matched. It is matched right
+    after the channel and group 1 spans the ': ' that follows, so the
+    message starts at m.end(1). scan_rx finds the lines of those channels
+    in bytes, for the memory-mapped scan.
+
+    config is user rules as returned by load_rules(); they come before
+    the built-in ones. min_keyword_filter picks the built-in warning rule
+    that keeps only warnings mentioning damage over the one keeping all.
+    """
+
+    def __init__(self, config=None, min_keyword_filter=True):
+        config = config or {}
+        disabled = set(config.get('disable', ()))
+        specs = [spec for spec in list(config.get('rule', ())) + BUILTIN_RULES
+                 if spec.get('keyword_filter', min_keyword_filter) == min_keyword_filter
+                 and spec.get('name') not in disabled]
+        self.rules = {}
+        by_channel = {}
+        for index, spec in enumerate(specs):
+            rule = Rule(spec, index)
+            if any(other.name == rule.name for other in self.rules.values()):
+                raise ValueError(f'rule {rule.name}: name already used, disable the other rule first')
+            self.rules[rule.group] = rule
+            by_channel.setdefault(rule.channel, []).append(rule)
+        self.channels = {
+            channel: re.compile(r'(:[ \t]*)(?:' + '|'.join(
+                f'(?P<{rule.group}>{rule.pattern})' for rule in rules) + ')').match
+            for channel, rules in by_channel.items()
+        }
+        # Finds the lines of those channels in a memory-mapped log
+        self.scan_rx = re.compile(b'^[0-9\\.]+ (?:' + b'|'.join(
+            re.escape(channel.encode('utf-8')) for channel in by_channel) + b'):', re.MULTILINE)
+        self.fields = {group: tuple(f'{group}_{name}' for name in rule.fields)
+                       for group, rule in self.rules.items()}
+
+    def extract(self, m):
+        """The rule that matched and its fields as a dict."""
+        rule = self.rules[m.lastgroup]
+        return rule, {name: m.group(group) for name, group in zip(rule.fields, self.fields[m.lastgroup])}
+
+_compiled = {}
+
+def compile_rules(config=None, min_keyword_filter=True):
+    """RuleSet for config, compiled once per distinct config."""
+    key = (rules_digest(config), min_keyword_filter)
+    rules = _compiled.get(key)
+    if rules is None:
+        rules = _compiled[key] = RuleSet(config, min_keyword_filter)
+    return rules
@@ -0,0 +1,366 @@
+import re
+import operator
+from array import array
+from bisect import bisect_left, insort
+
+def sort_number(value):
+    try:
+        return float(value)
+    except ValueError:
+        return float('-inf')
+
+# Searchable fields of each tab: text fields match substrings, numeric fields
+# compare with >, >=, <, <= or =. Text fields also make up the free-text key.
+# sort maps each column to the key its rows are ordered by.
+COMBAT_SEARCH = {
+    'text': {'victim': 'Victim', 'health': 'Health', 'source': 'Source', 'damage': 'Damage'},
+    'numeric': {'damage': 'Value', 'health': 'Health'},
+    'aliases': {'target': 'victim'},
+    'sort': {
+        'Target': lambda r: r['Victim'].lower(),
+        'Health': lambda r: sort_number(r['Health']),
+        'Source': lambda r: r['Source'].lower(),
+        'Damage': lambda r: r['Value'],
+        'Time': lambda r: r['Offset'],
+    },
+}
+WARNING_SEARCH = {
+    'text': {'message': 'Messages'},
+    'numeric': {'damage': 'MaxDamage', 'count': 'Count'},
+    'aliases': {'messages': 'message', 'maxdamage': 'damage'},
+    'sort': {
+        'Time': lambda r: r['Offset'],
+        'MaxDamage': lambda r: r['MaxDamage'],
+        'Count': lambda r: r['Count'],
+        'Messages': lambda r: r['Messages'][0].lower() if r['Messages'] else '',
+    },
+}
+SEARCH_SPECS = {'combat': COMBAT_SEARCH, 'warnings': WARNING_SEARCH}
+query_term_rx = re.compile(r'^([a-z]+)(:|>=|<=|>|<|=)(.+)$')
+token_rx = re.compile(r'[a-z0-9]+')
+compare_ops = {'>': operator.gt, '>=': operator.ge, '<': operator.lt, '<=': operator.le, '=': operator.eq}
+
+class Descending:
+    """Sort key wrapper that orders values the other way round."""
+
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __eq__(self, other):
+        return self.value == other.value
+
+    def __lt__(self, other):
+        return other.value < self.value
+
+def descending(indices, keys):
+    """indices, ascending by keys then index, in descending key order;
+    equal keys keep their ascending index order."""
+    result = []
+    end = len(indices)
+    while end:
+        start = bisect_left(indices, keys[indices[end - 1]], 0, end, key=keys.__getitem__)
+        result.extend(indices[start:end])
+        end = start
+    return result
+
+class SortOrders:
+    """Cached sort orders for the columns of a SearchIndex.
+
+    Each order is a permutation of row indices, ascending by key and then by
+    index, built the first time its column is sorted. Rows added, changed
+    or removed afterwards are placed with a binary search instead of
+    sorting the whole order again; ordering ties by index keeps that a
+    binary search too when most rows share a key.
+    """
+
+    def __init__(self, key_funcs):
+        self.key_funcs = key_funcs
+        self.keys = {}      # column -> sort key per row index
+        self.orders = {}    # column -> row indices in ascending key order
+
+    def order(self, col, rows):
+        if col not in self.orders:
+            keys = self.keys[col] = [self.key_funcs[col](r) if r is not None else None for r in rows]
+            self.orders[col] = sorted((i for i, r in enumerate(rows) if r is not None),
+                                      key=keys.__getitem__)
+        return self.orders[col]
+
+    def add(self, i, row):
+        for col, order in self.orders.items():
+            keys = self.keys[col]
+            keys.append(self.key_funcs[col](row))
+            # A new row has the highest index, so it goes after its equals
+            insort(order, i, key=keys.__getitem__)
+
+    def refresh(self, i, row):
+        for col, order in self.orders.items():
+            keys = self.keys[col]
+            new_key = self.key_funcs[col](row)
+            if new_key != keys[i]:
+                self._discard(col, i)
+                keys[i] = new_key
+                insort(order, i, key=lambda j: (keys[j], j))
+
+    def remove(self, i):
+        for col in self.orders:
+            self._discard(col, i)
+
+    def _discard(self, col, i):
+        order, keys = self.orders[col], self.keys[col]
+        del order[bisect_left(order, (keys[i], i), key=lambda j: (keys[j], j))]
+
+class SearchIndex:
+    """Filter index over the rows of one tab.
+
+    Each row gets a precomputed lowercased key made of its text fields, and
+    numeric fields are kept in parallel arrays. Logs with more than
+    TOKEN_THRESHOLD rows also get a token -> rows index that narrows the
+    candidates before the substring check. A query that only adds to the
+    previous one is run against the previous result instead of every row.
+
+    Queries are whitespace separated terms, ANDed together: field:text,
+    field>number (also >=, <, <=, =) and free text, which is matched as one
+    phrase against the whole key, e.g. "source:eximus damage>1e6".
+    """
+
+    TOKEN_THRESHOLD = 20000
+
+    def __init__(self, spec):
+        self.spec = spec
+        self.text_fields = spec['text']
+        self.numeric_fields = spec['numeric']
+        self.aliases = spec['aliases']
+        self.field_pos = {name: i for i, name in enumerate(self.text_fields)}
+        self.rows = []          # None where a row was removed
+        self.removed = 0
+        self.keys = []
+        self.numbers = {name: array('d') for name in self.numeric_fields}
+        self.positions = {}     # row -> index
+        self.tokens = None
+        self.token_cache = {}
+        self.terms = []
+        self.result = None      # indices matching self.terms
+        self.result_set = set()
+        self.sort_orders = SortOrders(spec['sort'])
+
+    def add(self, rows):
+        start = len(self.rows)
+        for row in rows:
+            self.positions[row] = len(self.rows)
+            self.rows.append(row)
+            self.keys.append(None)
+            for name in self.numbers:
+                self.numbers[name].append(0.0)
+            self._index(len(self.rows) - 1)
+            self.sort_orders.add(len(self.rows) - 1, row)
+        if self.result is not None:
+            self._extend_result(range(start, len(self.rows)))
+        return self
+
+    def refresh(self, row):
+        """Re-index a row whose fields changed (a warning group that grew).
+
+        Returns True if the change made it match the last search, False if
+        it made it stop matching (e.g. 'count<3') and None otherwise.
+        """
+        i = self.positions[row]
+        self._index(i)
+        self.sort_orders.refresh(i, row)
+        if self.result is None:
+            return None
+        matches = self._matches(i, self.terms)
+        if matches == (i in self.result_set):
+            return None
+        if matches:
+            self.result.append(i)
+            self.result_set.add(i)
+        else:
+            self.result_set.discard(i)
+            # Groups grow while they are recent, so i is near the end
+            for k in range(len(self.result) - 1, -1, -1):
+                if self.result[k] == i:
+                    del self.result[k]
+                    break
+        return matches
+
+    def remove(self, row):
+        # self.result may still list i; ordered() goes by result_set
+        i = self.positions.pop(row)
+        self.sort_orders.remove(i)
+        self.rows[i] = self.keys[i] = None
+        self.result_set.discard(i)
+        self.removed += 1
+
+    def compact(self):
+        """Rebuild without the removed rows once they outnumber the others,
+        so an index that keeps losing its oldest rows doesn't keep growing.
+        The last search stays applied; sort orders are rebuilt on demand."""
+        if self.removed <= len(self.rows) - self.removed:
+            return
+        rows, terms, searched = [row for row in self.rows if row is not None], self.terms, self.result is not None
+        self.__init__(self.spec)
+        self.terms = terms
+        if searched:
+            self.result = []
+        self.add(rows)
+
+    def _index(self, i):
+        row = self.rows[i]
+        fields = []
+        for attr in self.text_fields.values():
+            value = row.get(attr, '')
+            fields.append('\n'.join(value) if isinstance(value, list) else str(value))
+        key = self.keys[i] = '\x00'.join(fields).lower()
+        for name, attr in self.numeric_fields.items():
+            try:
+                self.numbers[name][i] = float(row.get(attr, 0))
+            except ValueError:
+                self.numbers[name][i] = float('nan')
+        if self.tokens is not None:
+            for token in set(token_rx.findall(key)):
+                self.tokens.setdefault(token, array('I')).append(i)
+            self.token_cache.clear()
+
+    def _extend_result(self, indices):
+        new = [i for i in indices if self._matches(i, self.terms)]
+        self.result.extend(new)
+        self.result_set.update(new)
+
+    def parse(self, query):
+        terms, phrase = [], []
+        for word in query.lower().split():
+            m = query_term_rx.match(word)
+            field = m and self.aliases.get(m.group(1), m.group(1))
+            if m and m.group(2) == ':' and field in self.text_fields:
+                terms.append(('text', self.field_pos[field], m.group(3)))
+            elif m and m.group(2) != ':' and field in self.numeric_fields:
+                try:
+                    terms.append(('num', field, m.group(2), float(m.group(3))))
+                    continue
+                except ValueError:
+                    pass
+                phrase.append(word)
+            else:
+                phrase.append(word)
+        if phrase:
+            terms.append(('text', None, ' '.join(phrase)))
+        return terms
+
+    @staticmethod
+    def implies(new, old):
+        # Whether every row matching term new also matches term old
+        if new[:2] != old[:2]:
+            return False
+        if new[0] == 'text':
+            return old[2] in new[2]
+        op, value = new[2], new[3]
+        if op != old[2]:
+            return False
+        if op in ('>', '>='):
+            return value >= old[3]
+        if op in ('<', '<='):
+            return value <= old[3]
+        return value == old[3]
+
+    def _matches(self, i, terms):
+        key = self.keys[i]
+        if key is None:
+            return False
+        for term in terms:
+            if term[0] == 'text':
+                text = key if term[1] is None else key.split('\x00')[term[1]]
+                if term[2] not in text:
+                    return False
+            elif not compare_ops[term[2]](self.numbers[term[1]][i], term[3]):
+                return False
+        return True
+
+    def matches(self, row):
+        """Whether row matches the query of the last search."""
+        i = self.positions.get(row)
+        return i is not None and self._matches(i, self.terms)
+
+    def _candidates(self, terms):
+        if self.result is not None and all(any(self.implies(new, old) for new in terms)
+                                           for old in self.terms):
+            # The new query only narrows the previous one
+            return self.result
+        needles = [t for term in terms if term[0] == 'text' for t in token_rx.findall(term[2])]
+        if not needles or len(self.rows) < self.TOKEN_THRESHOLD:
+            return range(len(self.rows))
+
+        if self.tokens is None:
+            self.tokens = {}
+            for i, key in enumerate(self.keys):
+                if key is not None:
+                    for token in set(token_rx.findall(key)):
+                        self.tokens.setdefault(token, array('I')).append(i)
+        # Every run of letters/digits in the query lies inside one token
+        # of a matching key, so rows without such a token can be skipped
+        needle = max(needles, key=len)
+        if needle not in self.token_cache:
+            found = set()
+            for token, rows in self.tokens.items():
+                if needle in token:
+                    found.update(rows)
+            self.token_cache[needle] = sorted(found)
+        return self.token_cache[needle]
+
+    def search(self, query):
+        """Filter the rows by query; read them back with ordered()."""
+        terms = self.parse(query)
+        if not terms:
+            self.terms, self.result = [], None
+            self.result_set = set()
+            return
+        candidates = self._candidates(terms)
+        self.terms = terms
+        self.result = [i for i in candidates if self._matches(i, terms)]
+        self.result_set = set(self.result)
+
+    def ordered(self, sort=None):
+        """Return the rows matching the last search, sorted by sort=(column,
+        reverse); rows with equal keys stay in log order either way."""
+        if sort is None:
+            if self.result is None:
+                return [row for row in self.rows if row is not None]
+            return [self.rows[i] for i in self.result if i in self.result_set]
+
+        col, reverse = sort
+        order = self.sort_orders.order(col, self.rows)
+        if self.result is None:
+            indices = order
+        elif len(self.result) * max(1, len(self.result).bit_length()) < len(order):
+            # Sorting a small result beats walking the whole order
+            keys = self.sort_orders.keys[col]
+            indices = sorted((i for i in self.result if i in self.result_set),
+                             key=lambda i: (keys[i], i))
+        else:
+            indices = [i for i in order if i in self.result_set]
+        if reverse:
+            indices = descending(indices, self.sort_orders.keys[col])
+        return [self.rows[i] for i in indices]
+
+    def sort_key(self, sort):
+        """Key placing rows where ordered(sort) lists them, for keeping a
+        list of shown rows sorted as rows come and go."""
+        col, reverse = sort
+        self.sort_orders.order(col, self.rows)
+        keys, positions = self.sort_orders.keys[col], self.positions
+        if reverse:
+            return lambda row: (Descending(keys[positions[row]]), positions[row])
+        return lambda row: (keys[positions[row]], positions[row])
+
+    def insert_sorted(self, rows, row, sort):
+        """Insert row into rows, a list in ordered(sort) order."""
+        insort(rows, row, key=self.sort_key(sort))
+
+    def remove_sorted(self, rows, row, sort):
+        """Take row out of rows, a list in ordered(sort) order; call it before
+        the row is removed or refreshed here."""
+        key = self.sort_key(sort)
+        pos = bisect_left(rows, key(row), key=key)
+        if pos < len(rows) and rows[pos] is row:
+            del rows[pos]
@@ -0,0 +1,171 @@
+import os
+import re
+import json
+import sqlite3
+import tempfile
+import weakref
+
+from ee_parser import combat_message
+
+SCHEMA = """
+CREATE TABLE combat (
+    offset REAL NOT NULL,
+    victim TEXT NOT NULL,
+    state TEXT NOT NULL,
+    health TEXT NOT NULL,
+    damage TEXT NOT NULL,
+    value REAL NOT NULL,
+    source TEXT NOT NULL
+);
+CREATE TABLE warnings (
+    offset REAL NOT NULL,
+    count INTEGER NOT NULL,
+    max_damage REAL NOT NULL,
+    messages TEXT NOT NULL
+);
+CREATE TABLE matches (
+    offset REAL NOT NULL,
+    rule TEXT NOT NULL,
+    message TEXT NOT NULL,
+    fields TEXT NOT NULL
+);
+"""
+# Delta keys of LogParser.retire() and the tables their rows go to
+TABLES = {'CombatEvents': 'combat', 'WarningGroups': 'warnings', 'Matches': 'matches'}
+BATCH_ROWS = 4096   # rows per fetch when reading back
+retention_rx = re.compile(r'(\d+)\s*(m|min|minutes?|rows?)\b')
+
+def parse_retention(text):
+    """(minutes, rows) of a retention policy like '60 min', '50000 rows' or
+    both, None for each not given; 'all' (or blank) keeps everything."""
+    text = text.strip().lower()
+    if text in ('', 'all'):
+        return None, None
+    terms = retention_rx.findall(text)
+    if not terms or retention_rx.sub('', text).strip(' ,'):
+        raise ValueError(f"retention {text!r}: expected e.g. '60 min', '50000 rows' or 'all'")
+    minutes = rows = None
+    for number, unit in terms:
+        if unit.startswith('row'):
+            rows = int(number)
+        else:
+            minutes = int(number)
+    return minutes, rows
+
+class SpilledRow(dict):
+    """A row read back from a SpillFile. Compares and hashes by identity,
+    like the parser's rows, so it can be indexed the same way."""
+
+    __eq__ = object.__eq__
+    __hash__ = object.__hash__
+
+def _cleanup(db, path):
+    db.close()
+    for name in (path, path + '-wal', path + '-shm'):
+        try:
+            os.remove(name)
+        except OSError:
+            pass
+
+class SpillFile:
+    """Rows retired from a live session, kept in a scratch SQLite file.
+
+    LogParser.retire() hands over the rows that no longer fit in memory;
+    add() appends them in order, so the file holds the oldest part of the
+    session and the parser the rest. rows() reads them back as SpilledRows,
+    dicts shaped like the parser's rows (see ee_parser.as_dicts), for
+    searching and exporting; times are formatted with the clock passed in,
+    so the UTC setting still applies. The file is deleted on close(), or
+    at exit at the latest.
+    """
+
+    def __init__(self, directory=None):
+        fd, self.path = tempfile.mkstemp(prefix='ee-spill-', suffix='.sqlite3', dir=directory)
+        os.close(fd)
+        # WAL lets exports read while rows are added; nothing needs to
+        # survive a crash, so nothing is synced. The file may be filled on
+        # a parse worker before the Tk thread takes it over, never both
+        self.db = sqlite3.connect(self.path, check_same_thread=False)
+        self.db.execute('PRAGMA journal_mode = WAL')
+        self.db.execute('PRAGMA synchronous = OFF')
+        self.db.executescript(SCHEMA)
+        self.counts = dict.fromkeys(TABLES, 0)
+        self._finalizer = weakref.finalize(self, _cleanup, self.db, self.path)
+
+    def close(self):
+        self._finalizer()
+
+    def add(self, retired):
+        """Append the rows of a LogParser.retire() result."""
+        with self.db:
+            if rows := retired.get('CombatEvents'):
+                self.db.executemany('INSERT INTO combat VALUES (?, ?, ?, ?, ?, ?, ?)', (
+                    (e['Offset'], e['Victim'], e['State'], e['Health'], e['Damage'], e['Value'], e['Source'])
+                    for e in rows))
+            if rows := retired.get('WarningGroups'):
+                # Messages as [text, damage or null] pairs, damage being the
+                # parsed 'high dmg' value
+                self.db.executemany('INSERT INTO warnings VALUES (?, ?, ?, ?)', (
+                    (g['Offset'], g['Count'], g['MaxDamage'],
+                     json.dumps([[c['Message'], c['Value'] if c['Damage'] else None] for c in g['Children']]))
+                    for g in rows))
+            if rows := retired.get('Matches'):
+                self.db.executemany('INSERT INTO matches VALUES (?, ?, ?, ?)', (
+                    (m['Offset'], m['Rule'], m['Message'], json.dumps(m['Fields'])) for m in rows))
+        for key, rows in retired.items():
+            self.counts[key] += len(rows)
+
+    def total(self):
+        return sum(self.counts.values())
+
+    def rows(self, kind, clock, limit=None):
+        """Yield the spilled rows of kind ('CombatEvents', 'WarningGroups' or
+        'Matches') in log order, the first limit only if given.
+
+        Reads through a connection of its own, so it can run on another
+        thread while rows are still being added; pass limit=counts[kind]
+        taken beforehand to leave out rows spilled meanwhile.
+        """
+        table = TABLES[kind]
+        make_row = getattr(self, f'_{table}_row')
+        db = sqlite3.connect(self.path)
+        try:
+            cursor = db.execute(f'SELECT * FROM {table} ORDER BY rowid LIMIT ?',
+                                (-1 if limit is None else limit,))
+            while batch := cursor.fetchmany(BATCH_ROWS):
+                for row in batch:
+                    yield make_row(row, clock)
+        finally:
+            db.close()
+
+    @staticmethod
+    def _combat_row(row, clock):
+        off, victim, state, health, damage, value, source = row
+        t = clock(off)
+        return SpilledRow({
+            'Type': 'Combat', 'Offset': off, 'Time': t, 'Victim': victim, 'State': state,
+            'Damage': damage, 'Health': health, 'Source': source,
+            'Message': combat_message(t, victim, state, damage, health, source), 'Value': value,
+        })
+
+    @staticmethod
+    def _warnings_row(row, clock):
+        off, count, max_damage, messages = row
+        t = clock(off)
+        messages = json.loads(messages)
+        return SpilledRow({
+            'Type': 'WarningGroup', 'Offset': off, 'Time': t, 'Count': count, 'MaxDamage': max_damage,
+            'Messages': [text for text, _ in messages],
+            'Children': [{'Offset': off, 'Time': t, 'Message': text,
+                          'Damage': f"{value:.2e}" if value is not None else '',
+                          'Value': 0 if value is None else value}
+                         for text, value in messages],
+        })
+
+    @staticmethod
+    def _matches_row(row, clock):
+        off, rule, message, fields = row
+        return SpilledRow({
+            'Type': 'Match', 'Offset': off, 'Time': clock(off), 'Rule': rule,
+            'Message': message, 'Fields': json.loads(fields),
+        })
@@ -0,0 +1,179 @@
+import math
+import heapq
+from collections import Counter
+
+class QuantileSketch:
+    """Streaming quantiles of positive values with relative error alpha.
+
+    Values fall into logarithmic buckets (a DDSketch without collapsing), so
+    any quantile is within alpha of the true value relative to its size,
+    whatever the distribution. Memory is one counter per occupied bucket,
+    about 1400 for values from 1 to 1e12 at 1 %. Values can be removed as
+    well as added. Zero and negative values are only counted, as zeros.
+    """
+
+    def __init__(self, alpha=0.01):
+        self.gamma = (1 + alpha) / (1 - alpha)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets = {}
+        self.zeros = 0
+        self.count = 0
+
+    def add(self, value, n=1):
+        self.count += n
+        if value > 0:
+            key = math.ceil(math.log(value) / self.log_gamma)
+            left = self.buckets.get(key, 0) + n
+            if left:
+                self.buckets[key] = left
+            else:
+                del self.buckets[key]
+        else:
+            self.zeros += n
+
+    def remove(self, value, n=1):
+        self.add(value, -n)
+
+    def quantile(self, q):
+        """The value at rank q (0 to 1), or None while empty."""
+        if self.count <= 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zeros
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                # Midpoint of the bucket (gamma^(key-1), gamma^key]
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+def decade(value):
+    """Histogram bucket of value: its power of ten, None for zero."""
+    return math.floor(math.log10(value)) if value > 0 else None
+
+class SessionStats:
+    """Aggregates of one parsed session, kept up to date from parse deltas.
+
+    Every combat event and warning group is folded in once, in O(1): counts
+    per victim and state, per source hits, total and max damage, a damage
+    quantile sketch (of nonzero damage), a per-decade damage histogram and
+    events per minute.
+    Warning groups that grow or are superseded later are adjusted by the
+    difference, so nothing is ever recomputed from the rows. Rankings and
+    quantiles are worked out in snapshot(), from the aggregates only.
+    """
+
+    TOP = 10        # sources listed per ranking
+    QUANTILES = (0.5, 0.9, 0.99)
+
+    def __init__(self):
+        self.events = 0
+        self.states = Counter()
+        self.victims = {}       # victim -> Counter of states
+        self.sources = {}       # source -> [hits, total damage, max damage]
+        self.damage = QuantileSketch()
+        self.decades = Counter()
+        self.minutes = Counter()    # minute of the log -> combat events
+        self.first_minute = self.last_minute = None
+        self.max_damage = 0.0
+        self.groups = 0
+        self.messages = 0
+        self.warning_damage = QuantileSketch()
+        self.counted = {}       # warning group -> (messages, max damage) counted
+
+    def apply(self, delta):
+        """Fold in a LogParser.update() delta."""
+        self.remove_groups(delta['RemovedGroups'])
+        self.add_events(delta['CombatEvents'])
+        self.add_groups(delta['WarningGroups'])
+        self.add_groups(delta['UpdatedGroups'])
+
+    def add_events(self, events):
+        victims, sources, states = self.victims, self.sources, self.states
+        for event in events:
+            state, value = event['State'], event['Value']
+            states[state] += 1
+            counts = victims.get(event['Victim'])
+            if counts is None:
+                counts = victims[event['Victim']] = Counter()
+            counts[state] += 1
+            source = sources.get(event['Source'])
+            if source is None:
+                source = sources[event['Source']] = [0, 0.0, 0.0]
+            source[0] += 1
+            source[1] += value
+            if value > source[2]:
+                source[2] = value
+            if value > 0:
+                self.damage.add(value)
+            self.decades[decade(value)] += 1
+            minute = int(event['Offset'] // 60)
+            self.minutes[minute] += 1
+            if self.first_minute is None or minute < self.first_minute:
+                self.first_minute = minute
+            if self.last_minute is None or minute > self.last_minute:
+                self.last_minute = minute
+            if value > self.max_damage:
+                self.max_damage = value
+            self.events += 1
+
+    def add_groups(self, groups):
+        # New groups and groups that grew: only the difference is counted
+        for group in groups:
+            count, peak = group['Count'], group['MaxDamage']
+            old = self.counted.get(group)
+            if old is None:
+                self.groups += 1
+            else:
+                self.messages -= old[0]
+                if old[1] > 0:
+                    self.warning_damage.remove(old[1])
+            self.messages += count
+            if peak > 0:
+                self.warning_damage.add(peak)
+            self.counted[group] = count, peak
+
+    def remove_groups(self, groups):
+        for group in groups:
+            old = self.counted.pop(group, None)
+            if old is not None:
+                self.groups -= 1
+                self.messages -= old[0]
+                if old[1] > 0:
+                    self.warning_damage.remove(old[1])
+
+    def forget_groups(self, groups):
+        """Stop tracking groups that left memory for good (see
+        LogParser.retire); what they added to the totals stays."""
+        for group in groups:
+            self.counted.pop(group, None)
+
+    def snapshot(self, top=None):
+        """The aggregates as plain data, for display or JSON."""
+        top = top or self.TOP
+        minutes = self.minutes
+        span = self.last_minute - self.first_minute + 1 if minutes else 0
+        peak = max(minutes.items(), key=lambda item: item[1]) if minutes else None
+        recent = range(max(self.last_minute - 9, self.first_minute), self.last_minute + 1) if minutes else ()
+        return {
+            'Events': self.events,
+            'States': dict(self.states.most_common()),
+            'Victims': heapq.nlargest(top * 2, ((victim, dict(counts)) for victim, counts in self.victims.items()),
+                                      key=lambda item: sum(item[1].values())),
+            'MaxDamage': self.max_damage,
+            'Percentiles': {q: self.damage.quantile(q) for q in self.QUANTILES},
+            'TopByMax': heapq.nlargest(top, ((s, v[2], v[0]) for s, v in self.sources.items()),
+                                       key=lambda item: item[1]),
+            'TopByTotal': heapq.nlargest(top, ((s, v[1], v[0]) for s, v in self.sources.items()),
+                                         key=lambda item: item[1]),
+            'PerMinute': self.events / span if span else 0.0,
+            'PeakMinute': peak,
+            'RecentMinutes': [(minute, minutes.get(minute, 0)) for minute in recent],
+            'Histogram': sorted(((d, n) for d, n in self.decades.items() if d is not None)),
+            'ZeroDamage': self.decades.get(None, 0),
+            'WarningGroups': self.groups,
+            'WarningMessages': self.messages,
+            'WarningPercentiles': {q: self.warning_damage.quantile(q) for q in self.QUANTILES},
+        }
@@ -0,0 +1,200 @@
+import os
+import sys
+import queue
+import select
+import struct
+import ctypes
+import ctypes.util
+import threading
+import time
+
+# inotify(7) event masks
+IN_MODIFY = 0x002
+IN_ATTRIB = 0x004
+IN_CLOSE_WRITE = 0x008
+IN_MOVED_FROM = 0x040
+IN_MOVED_TO = 0x080
+IN_CREATE = 0x100
+IN_DELETE = 0x200
+IN_Q_OVERFLOW = 0x4000
+IN_NONBLOCK = os.O_NONBLOCK
+IN_CLOEXEC = 0o2000000
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+EVENT_HEADER = struct.Struct('iIII')  # wd, mask, cookie, name length
+
+class PollingBackend:
+    """Wakes up on every timeout; the watcher's stat calls do the work."""
+
+    name = 'polling'
+    max_interval = 0.5
+
+    def __init__(self, path):
+        self.woken = threading.Event()
+
+    def wait(self, timeout):
+        self.woken.wait(timeout)
+        self.woken.clear()
+
+    def wake(self):
+        self.woken.set()
+
+    def close(self):
+        pass
+
+class InotifyBackend:
+    """Blocks until inotify reports activity on the log (Linux only).
+
+    The directory is watched rather than the file, so the game deleting,
+    renaming or recreating EE.log is seen as well as writes to it. The
+    timeout still bounds each wait, as a safety net for filesystems that
+    don't deliver events (network shares, some Wine/Proton setups).
+    """
+
+    name = 'inotify'
+    max_interval = 10.0
+
+    def __init__(self, path):
+        libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), 'inotify_init1 failed')
+        directory = os.path.dirname(os.path.abspath(path))
+        if libc.inotify_add_watch(self.fd, os.fsencode(directory), WATCH_MASK) < 0:
+            errno = ctypes.get_errno()
+            os.close(self.fd)
+            raise OSError(errno, f'inotify_add_watch failed for {directory}')
+        self.name_bytes = os.fsencode(os.path.basename(path))
+        self.wake_r, self.wake_w = os.pipe()
+        self.lock = threading.Lock()
+        self.closed = False
+
+    def wait(self, timeout):
+        # Activity on other files in the directory doesn't end the wait
+        deadline = time.monotonic() + timeout
+        while (remaining := deadline - time.monotonic()) > 0:
+            ready, _, _ = select.select([self.fd, self.wake_r], [], [], remaining)
+            if self.wake_r in ready:
+                os.read(self.wake_r, 512)
+                return
+            if self.fd in ready and self.drain():
+                return
+
+    def drain(self):
+        # Events are coalesced: the watcher stats the file once per wake-up
+        relevant = False
+        try:
+            while data := os.read(self.fd, 64 * 1024):
+                pos = 0
+                while pos < len(data):
+                    _, mask, _, length = EVENT_HEADER.unpack_from(data, pos)
+                    pos += EVENT_HEADER.size
+                    name = data[pos:pos + length].rstrip(b'\0')
+                    pos += length
+                    relevant |= name == self.name_bytes or bool(mask & IN_Q_OVERFLOW)
+        except BlockingIOError:
+            pass
+        return relevant
+
+    def wake(self):
+        with self.lock:
+            if not self.closed:
+                os.write(self.wake_w, b'x')
+
+    def close(self):
+        with self.lock:
+            if not self.closed:
+                self.closed = True
+                for fd in (self.fd, self.wake_r, self.wake_w):
+                    os.close(fd)
+
+def make_backend(path):
+    if sys.platform.startswith('linux'):
+        try:
+            return InotifyBackend(path)
+        except (OSError, AttributeError):
+            pass  # no inotify (old libc, limits reached): poll instead
+    return PollingBackend(path)
+
+class LogWatcher(threading.Thread):
+    """Watches one log file on a background thread and queues its changes.
+
+    Each change is a (kind, size) tuple on self.queue, kind being 'grown',
+    'truncated' (same file, now shorter or with a different start: the
+    game restarted and reused it), 'replaced' (another file now has the
+    path, seen through the device and inode) or 'missing'. known_size is
+    how much of the file the caller has already seen, so growth since then
+    is reported at once.
+
+    The file is stat'ed after every wake-up. The wait starts at
+    MIN_INTERVAL and backs off by BACKOFF while the file stays idle, up to
+    the backend's max_interval; any change snaps it back. With inotify the
+    waits end as soon as the file is touched, so the interval only matters
+    for the polling fallback and as a safety net.
+    """
+
+    MIN_INTERVAL = 0.05
+    BACKOFF = 1.5
+    HEAD_BYTES = 512    # a rewritten file is caught by its first bytes changing
+
+    def __init__(self, path, known_size=0, backend=None):
+        super().__init__(daemon=True)
+        self.path = path
+        self.queue = queue.Queue()
+        self.stopped = threading.Event()
+        self.backend = backend or make_backend(path)
+        self.identity = None
+        self.size = known_size
+        self.head = self.read_head()
+        try:
+            st = os.stat(path)
+            self.identity = (st.st_dev, st.st_ino)
+        except OSError:
+            pass
+
+    def stop(self):
+        self.stopped.set()
+        self.backend.wake()
+
+    def run(self):
+        interval = self.MIN_INTERVAL
+        try:
+            while not self.stopped.is_set():
+                if self.check():
+                    interval = self.MIN_INTERVAL
+                else:
+                    interval = min(interval * self.BACKOFF, self.backend.max_interval)
+                self.backend.wait(interval)
+        finally:
+            self.backend.close()
+
+    def check(self):
+        """Stat the file and queue what changed; returns True on a change."""
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            if self.identity is None:
+                return False
+            self.identity, self.size = None, 0
+            self.queue.put(('missing', 0))
+            return True
+        identity = (st.st_dev, st.st_ino)
+        if identity == self.identity and st.st_size == self.size:
+            return False
+        head = self.read_head()
+        common = min(len(head), len(self.head))
+        if identity != self.identity:
+            kind = 'replaced'
+        elif st.st_size < self.size or head[:common] != self.head[:common]:
+            kind = 'truncated'
+        else:
+            kind = 'grown'
+        self.identity, self.size, self.head = identity, st.st_size, head
+        self.queue.put((kind, st.st_size))
+        return True
+
+    def read_head(self):
+        try:
+            with open(self.path, 'rb') as f:
+                return f.read(self.HEAD_BYTES)
+        except OSError:
+            return b''
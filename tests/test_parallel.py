@@ -0,0 +1,97 @@
+import random
+
+import pytest
+
+import ee_parser
+from ee_parser import LogParser, as_dicts
+from synth_log import generate
+
+RULES = {
+    'disable': ['razorflies'],
+    'rule': [
+        {'name': 'spawn', 'channel': 'Game [Info]', 'action': 'match',
+         'pattern': r'AI: spawning (?P<type>\S+) at wave (?P<wave>\d+)'},
+        {'name': 'no-missing-anim', 'channel': 'Game [Warning]', 'action': 'ignore',
+         'pattern': 'Missing animation'},
+    ],
+}
+
+@pytest.fixture(autouse=True)
+def small_chunks(monkeypatch):
+    # Enough ranges per log for every worker to get several
+    monkeypatch.setattr(ee_parser, 'PARALLEL_CHUNK', 16 * 1024)
+
+def results(parser):
+    return {key: as_dicts(rows) if isinstance(rows, list) else rows
+            for key, rows in parser.result().items()}
+
+def comparable(delta):
+    delta = {key: as_dicts(rows) if isinstance(rows, list) else rows for key, rows in delta.items()}
+    # Groups dropped in one update come out in no particular order
+    delta['RemovedGroups'] = sorted(map(repr, delta['RemovedGroups']))
+    return delta
+
+@pytest.mark.parametrize('keyword_filter', [True, False])
+@pytest.mark.parametrize('rules', [None, RULES])
+def test_parallel_matches_serial(tmp_path, keyword_filter, rules):
+    path = tmp_path / 'EE.log'
+    generate(path, 512 * 1024, seed=1)
+    serial = LogParser(str(path), keyword_filter, rules=rules)
+    serial.update(final=True, mode='stream')
+    parallel = LogParser(str(path), keyword_filter, rules=rules)
+    parallel.update(final=True, mode='parallel', jobs=3)
+    assert results(parallel) == results(serial)
+    assert serial.result()['WarningGroups']
+    if rules:
+        assert serial.result()['Matches']
+
+def test_every_line_in_a_range_of_its_own(tmp_path, monkeypatch):
+    # Warnings before, after and around a combat event at the same offset,
+    # and a burst of warnings, each cut apart by range boundaries
+    monkeypatch.setattr(ee_parser, 'PARALLEL_CHUNK', 1)
+    lines = [
+        '0.600 Sys [Info]: Logged in Tenno_Player (5f0c00000000000000000000)',
+        '0.700 Sys [Diag]: Current time: Sat Oct 17 20:01:02 2026 [UTC: Sat Oct 17 18:01:02 2026]',
+        '1.000 Game [Warning]: high dmg: 1.0000e+06 from Ogris',
+        '1.000 Game [Info]: Kuva Lich was killed by 12.00 / 5000.000 damage from a Grineer Lancer using a Grakata',
+        '1.000 Game [Warning]: high dmg: 2.0000e+06 from Ogris',
+        '2.000 Game [Info]: Tenno_Player was downed by 900.000 damage from a Eximus, Arson using a Napalm',
+        '2.000 Game [Warning]: high dmg: 3.0000e+09 (Napalm)',
+        '3.000 Game [Warning]: high dmg: 4.0000e+07 from Torid',
+        '3.000 Game [Warning]: Damage 5000 clamped on Kuva Lich',
+        '    continuation of the previous entry 1',
+        '3.000 Game [Warning]: high dmg: 6.0000e+08 from Torid',
+        '4.000 Game [Info]: AI: spawning /Lotus/Types/Enemies/Grineer/Lancer1 at wave 2',
+    ]
+    data = ''.join(line + '\r\n' for line in lines).encode()
+    path = tmp_path / 'EE.log'
+    path.write_bytes(data)
+    serial = LogParser(str(path), rules=RULES)
+    serial.update(final=True, mode='stream')
+    parallel = LogParser(str(path), rules=RULES)
+    parallel.update(final=True, mode='parallel', jobs=len(lines))
+    assert results(parallel) == results(serial)
+    assert [len(serial.result()[key]) for key in ('CombatEvents', 'WarningGroups', 'Matches')] == [2, 1, 1]
+
+@pytest.mark.parametrize('rules', [None, RULES])
+def test_parallel_deltas_match_serial(tmp_path, rules):
+    source = tmp_path / 'source.log'
+    generate(source, 512 * 1024, seed=2)
+    data = source.read_bytes()
+    path = tmp_path / 'EE.log'
+    path.write_bytes(b'')
+    serial = LogParser(str(path), rules=rules)
+    parallel = LogParser(str(path), rules=rules)
+    steps = random.Random(7)
+    pos = 0
+    while pos < len(data):
+        # Cut anywhere, mid-line included, like a log being written
+        step = steps.randint(1, 96 * 1024)
+        with open(path, 'ab') as f:
+            f.write(data[pos:pos + step])
+        pos += step
+        expected = comparable(serial.update(mode='stream'))
+        assert comparable(parallel.update(mode='parallel', jobs=3)) == expected
+    assert comparable(parallel.update(final=True, mode='parallel', jobs=3)) == \
+        comparable(serial.update(final=True, mode='stream'))
+    assert results(parallel) == results(serial)
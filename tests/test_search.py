@@ -0,0 +1,80 @@
+import pytest
+
+from ee_search import WARNING_SEARCH, SearchIndex
+from ee_spill import SpilledRow
+
+def group(offset, count):
+    return SpilledRow({'Offset': float(offset), 'Count': count, 'MaxDamage': count * 1e9,
+                       'Messages': [f'high dmg: {count}e9 at {offset}'] * count})
+
+def test_remove_under_filter_and_sort():
+    rows = [group(i, i % 10) for i in range(200)]
+    index = SearchIndex(WARNING_SEARCH).add(rows)
+    index.search('count>5')
+    expected = [row for row in rows if row['Count'] > 5]
+    gone = expected[3]
+    index.remove(gone)
+    expected.remove(gone)
+    # Both the small-result and the whole-order sort paths, and no sort
+    for sort in (('Count', False), ('Time', True), None):
+        ordered = index.ordered(sort)
+        assert None not in ordered
+        assert set(ordered) == set(expected)
+    assert index.ordered() == expected
+
+def test_remove_then_narrow_and_compact():
+    rows = [group(i, i % 10) for i in range(100)]
+    index = SearchIndex(WARNING_SEARCH).add(rows)
+    index.search('count>2')
+    for row in rows[:60]:
+        index.remove(row)
+    index.search('count>7')
+    assert index.ordered(('Count', False)) == sorted((r for r in rows[60:] if r['Count'] > 7),
+                                                    key=lambda r: r['Count'])
+    index.compact()
+    assert index.removed == 0 and len(index.rows) == 40
+    assert index.ordered() == [r for r in rows[60:] if r['Count'] > 7]
+
+def test_refresh_drops_rows_that_stop_matching():
+    rows = [group(i, 1) for i in range(50)]
+    index = SearchIndex(WARNING_SEARCH).add(rows)
+    index.search('count<3')
+    grown = rows[10]
+    for count, change in ((2, None), (5, False), (6, None), (1, True)):
+        grown.update(group(10, count))
+        assert index.refresh(grown) is change
+        assert index.ordered().count(grown) == (count < 3)
+
+def test_sorted_ties_stay_in_log_order():
+    rows = [group(i, 1 + i % 3) for i in range(300)]
+    index = SearchIndex(WARNING_SEARCH).add(rows)
+    by_count = sorted(rows, key=lambda r: r['Count'])
+    assert index.ordered(('Count', False)) == by_count
+    assert index.ordered(('Count', True)) == sorted(rows, key=lambda r: -r['Count'])
+    for row in rows[::7]:
+        index.remove(row)
+        by_count.remove(row)
+    assert index.ordered(('Count', False)) == by_count
+
+@pytest.mark.parametrize('sort', [('Count', False), ('Count', True), ('Time', True)])
+def test_keep_shown_rows_sorted(sort):
+    rows = [group(i, 1 + i % 4) for i in range(100)]
+    index = SearchIndex(WARNING_SEARCH).add(rows[:80])
+    index.search('count<4')
+    shown = index.ordered(sort)
+    for row in rows[:80:9]:
+        if index.matches(row):
+            index.remove_sorted(shown, row, sort)
+        index.remove(row)
+    for row in rows[10:18]:
+        if index.matches(row):
+            index.remove_sorted(shown, row, sort)
+        row.update(group(row['Offset'], row['Count'] + 1))
+        index.refresh(row)
+        if index.matches(row):
+            index.insert_sorted(shown, row, sort)
+    index.add(rows[80:])
+    for row in rows[80:]:
+        if index.matches(row):
+            index.insert_sorted(shown, row, sort)
+    assert shown == index.ordered(sort)